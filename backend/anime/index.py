@@ -1,280 +1,1196 @@
 '''
-Business: Anime CRUD operations - get, create, update, delete anime
-Args: event with httpMethod (GET/POST/PUT/DELETE), body, headers (X-Auth-Token for admin)
+Business: Anime CRUD operations - get, create, update, delete anime, plus catalog search, facets, rankings,
+      random pick, batch lookup, NDJSON export and bulk import
+Args: event with httpMethod (GET/POST/PUT/DELETE), body, headers (X-Auth-Token for admin),
+      queryStringParameters (id, ids, type, genre, year, search, limit, cursor, view, fields, facets, random,
+      ranking, export, updated_since, stats, action)
 Returns: HTTP response with anime data or operation result
 '''
 
 import json
 import os
-import jwt
-from typing import Dict, Any
-import psycopg2
-from psycopg2.extras import RealDictCursor
+import time
+import random
+import base64
+import gzip
+import csv
+import hashlib
+import io
+import threading
+from array import array
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Tuple
+from runtime import (
+    mark_module_loaded, run_handler, build_preflight_response, timed_phase, timed_cursor_factory,
+    GZIP_LEVEL, extras, configure_db, get_db_connection, release_db_connection, decode_token, dumps_json,
+    negotiate_encoding, compress_response
+)
+
+FUNCTION_NAME = 'anime'
+CATALOG_PAGE_DEFAULT_LIMIT = int(os.environ.get('CATALOG_PAGE_DEFAULT_LIMIT', '24'))
+CATALOG_PAGE_MAX_LIMIT = int(os.environ.get('CATALOG_PAGE_MAX_LIMIT', '100'))
+DETAIL_COMMENTS_LIMIT = int(os.environ.get('DETAIL_COMMENTS_LIMIT', '20'))
+
+CATALOG_CACHE_CONTROL = os.environ.get('CATALOG_CACHE_CONTROL', 'public, max-age=0, s-maxage=30, stale-while-revalidate=60')
+DETAIL_CACHE_CONTROL = os.environ.get('DETAIL_CACHE_CONTROL', 'no-cache')
+CATALOG_CACHE_TTL = float(os.environ.get('CATALOG_CACHE_TTL', '60'))
+CATALOG_CACHE_MAX_ENTRIES = int(os.environ.get('CATALOG_CACHE_MAX_ENTRIES', '256'))
+
+IMPORT_MAX_ROWS = int(os.environ.get('IMPORT_MAX_ROWS', '50000'))
+IMPORT_URL_MAX_LENGTH = int(os.environ.get('IMPORT_URL_MAX_LENGTH', '2048'))
+INT4_MAX = 2147483647
+RANDOM_ID_CACHE_TTL = float(os.environ.get('RANDOM_ID_CACHE_TTL', '300'))
+RANDOM_ID_CACHE_MAX_ENTRIES = int(os.environ.get('RANDOM_ID_CACHE_MAX_ENTRIES', '64'))
+BATCH_MAX_IDS = int(os.environ.get('BATCH_MAX_IDS', '100'))
+
+configure_db(decimal_as_float=True)
+
+RANKINGS = {'top': 'anime_top_rated', 'trending': 'anime_trending'}
+RANKINGS_REFRESH_INTERVAL = float(os.environ.get('RANKINGS_REFRESH_INTERVAL', '900'))
+RANKINGS_CACHE_CONTROL = os.environ.get('RANKINGS_CACHE_CONTROL', 'public, max-age=60, s-maxage=300')
+
+EXPORT_ITERSIZE = int(os.environ.get('EXPORT_ITERSIZE', '2000'))
+EXPORT_MAX_ROWS = int(os.environ.get('EXPORT_MAX_ROWS', '20000'))
+
+IMPORT_COLUMNS = ('external_id', 'title', 'description', 'type', 'genre', 'year', 'episodes', 'thumbnail_url', 'video_url', 'music_url')
+# Text columns that are never NULL, so a literal \N value is not read back as the NULL marker
+IMPORT_NOT_NULL_COLUMNS = 'external_id, title, description, type, genre, thumbnail_url'
+
+ANIME_COLUMNS = "id, external_id, title, description, type, genre, year, episodes, rating, rating_count, video_url, thumbnail_url, music_url, created_by, created_at, updated_at"
+FACET_COLUMNS = ('genre', 'year', 'type')
+ANIME_FIELDS = tuple(ANIME_COLUMNS.split(', '))
+ANIME_VIEWS = {
+    'full': ANIME_FIELDS,
+    'card': ('id', 'title', 'type', 'genre', 'year', 'episodes', 'rating', 'rating_count', 'thumbnail_url', 'created_at')
+}
 
 def verify_admin(token: str, jwt_secret: str) -> Dict[str, Any]:
     if not token:
         return None
     
     try:
-        payload = jwt.decode(token, jwt_secret, algorithms=['HS256'])
+        payload = decode_token(token, jwt_secret)
         if not payload.get('is_admin') and payload.get('role') != 'admin':
             return None
         return payload
     except:
         return None
 
-def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
-    method: str = event.get('httpMethod', 'GET')
+def encode_cursor(sort_key: Any, row_id: int) -> str:
+    if isinstance(sort_key, datetime):
+        sort_key = sort_key.isoformat()
+    raw = json.dumps([sort_key, row_id])
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor: str, key_type: type = datetime) -> Optional[Tuple[Any, int]]:
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        sort_key, row_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        if key_type is datetime:
+            datetime.fromisoformat(sort_key)
+        else:
+            sort_key = key_type(sort_key)
+        return sort_key, int(row_id)
+    except (ValueError, TypeError):
+        return None
+
+def parse_page_limit(limit: Optional[str]) -> Optional[int]:
+    if limit is None or limit == '':
+        return CATALOG_PAGE_DEFAULT_LIMIT
+    try:
+        value = int(limit)
+    except ValueError:
+        return None
+    if value < 1:
+        return None
+    return min(value, CATALOG_PAGE_MAX_LIMIT)
+
+_catalog_cache: OrderedDict = OrderedDict()
+_catalog_cache_lock = threading.Lock()
+_catalog_cache_stats: Dict[str, int] = {'hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0, 'invalidations': 0}
+
+def catalog_cache_get(key: Tuple) -> Optional[Tuple[str, Dict[str, str]]]:
+    with _catalog_cache_lock:
+        entry = _catalog_cache.get(key)
+        if entry is None:
+            _catalog_cache_stats['misses'] += 1
+            return None
+        expires_at, body, variants = entry
+        if expires_at <= time.monotonic():
+            del _catalog_cache[key]
+            _catalog_cache_stats['expirations'] += 1
+            _catalog_cache_stats['misses'] += 1
+            return None
+        _catalog_cache.move_to_end(key)
+        _catalog_cache_stats['hits'] += 1
+        return body, variants
+
+def catalog_cache_put(key: Tuple, body: str) -> Dict[str, str]:
+    variants: Dict[str, str] = {}
+    with _catalog_cache_lock:
+        _catalog_cache[key] = (time.monotonic() + CATALOG_CACHE_TTL, body, variants)
+        _catalog_cache.move_to_end(key)
+        while len(_catalog_cache) > CATALOG_CACHE_MAX_ENTRIES:
+            _catalog_cache.popitem(last=False)
+            _catalog_cache_stats['evictions'] += 1
+    return variants
+
+def invalidate_catalog_cache():
+    with _catalog_cache_lock:
+        _catalog_cache.clear()
+        _catalog_cache_stats['invalidations'] += 1
+
+def get_catalog_cache_stats() -> Dict[str, Any]:
+    lookups = _catalog_cache_stats['hits'] + _catalog_cache_stats['misses']
+    return {
+        **_catalog_cache_stats,
+        'hit_ratio': round(_catalog_cache_stats['hits'] / lookups, 4) if lookups else 0.0,
+        'size': len(_catalog_cache),
+        'max_entries': CATALOG_CACHE_MAX_ENTRIES,
+        'ttl_seconds': CATALOG_CACHE_TTL
+    }
+
+def normalize_catalog_filters(query_params: Dict[str, Any]) -> Tuple[Optional[Tuple], Optional[str]]:
+    anime_type = query_params.get('type')
+    genre = query_params.get('genre')
+    year = query_params.get('year')
+    search = (query_params.get('search') or '').strip().lower()
     
-    if method == 'OPTIONS':
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET, POST, PUT, DELETE, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-Auth-Token',
-                'Access-Control-Max-Age': '86400'
-            },
-            'body': '',
-            'isBase64Encoded': False
-        }
+    if year and year != 'Все':
+        try:
+            year = int(year)
+        except ValueError:
+            return None, 'year must be an integer'
+        if not -INT4_MAX <= year <= INT4_MAX:
+            return None, 'year is out of range'
+    else:
+        year = None
+    
+    return (
+        anime_type if anime_type and anime_type != 'all' else None,
+        genre if genre and genre != 'Все' else None,
+        year,
+        search or None
+    ), None
+
+def fetch_facets(cur, filters: Tuple) -> str:
+    anime_type, genre, year, _ = filters
+    active = {'genre': genre, 'year': year, 'type': anime_type}
+    parts = []
+    params: List[Any] = []
+    for facet in FACET_COLUMNS:
+        conditions = ['title_count > 0']
+        for column, value in active.items():
+            if column != facet and value is not None:
+                conditions.append(f"{column} = %s")
+                params.append(value)
+        parts.append(
+            f"SELECT '{facet}' AS facet, {facet}::text AS value, SUM(title_count)::int AS count "
+            f"FROM t_p29917108_anime_viewer_portal.anime_facets WHERE {' AND '.join(conditions)} GROUP BY {facet}"
+        )
+    
+    cur.execute(' UNION ALL '.join(parts) + ' ORDER BY facet, count DESC, value', params)
+    facets: Dict[str, List[Dict[str, Any]]] = {facet: [] for facet in FACET_COLUMNS}
+    for row in cur.fetchall():
+        value = int(row['value']) if row['facet'] == 'year' else row['value']
+        facets[row['facet']].append({'value': value, 'count': row['count']})
+    return dumps_json(facets)
+
+def resolve_projection(query_params: Dict[str, Any]) -> Tuple[Optional[str], Optional[str]]:
+    view = query_params.get('view')
+    fields = query_params.get('fields')
+    
+    if view and view not in ANIME_VIEWS:
+        return None, f"Unknown view '{view}', expected one of: {', '.join(ANIME_VIEWS)}"
+    
+    if not fields:
+        return ', '.join(ANIME_VIEWS[view or 'full']), None
+    
+    requested = [field.strip() for field in fields.split(',') if field.strip()]
+    unknown = [field for field in requested if field not in ANIME_FIELDS]
+    if unknown:
+        return None, f"Unknown fields: {', '.join(unknown)}"
+    
+    columns = ['id', 'created_at'] + [field for field in ANIME_FIELDS if field in requested and field not in ('id', 'created_at')]
+    return ', '.join(columns), None
+
+def fetch_catalog(cur, filters: Tuple, columns: str, page_size: Optional[int], position: Optional[Tuple[Any, int]]) -> str:
+    anime_type, genre, year, search = filters
+    select_list = columns
+    select_params = []
+    sort_column = 'created_at'
+    
+    if search:
+        select_list += ", (ts_rank(search_vector, websearch_to_tsquery('russian', %s)) + similarity(title, %s))::float8 AS search_rank"
+        select_params = [search, search]
+        sort_column = 'search_rank'
+    
+    query = f"SELECT {select_list} FROM t_p29917108_anime_viewer_portal.anime WHERE 1=1"
+    params = list(select_params)
+    
+    if anime_type:
+        query += " AND type = %s"
+        params.append(anime_type)
+    
+    if genre:
+        query += " AND genre = %s"
+        params.append(genre)
+    
+    if year:
+        query += " AND year = %s"
+        params.append(year)
+    
+    if search:
+        query += " AND (search_vector @@ websearch_to_tsquery('russian', %s) OR title %% %s OR title ILIKE %s)"
+        params.extend([search, search, f'%{search}%'])
+        query = f"SELECT {columns}, search_rank FROM ({query}) ranked WHERE 1=1"
+    
+    if position:
+        query += f" AND ({sort_column}, id) < (%s, %s)"
+        params.extend(position)
+    
+    query += f" ORDER BY {sort_column} DESC, id DESC"
+    
+    if page_size:
+        query += " LIMIT %s"
+        params.append(page_size + 1)
+    
+    cur.execute(query, params)
+    anime_list = cur.fetchall()
+    # search_rank only orders the page and positions the cursor; items carry just the projected columns
+    sort_keys = [row.pop('search_rank') if search else row[sort_column] for row in anime_list]
+    
+    if not page_size:
+        return dumps_json(anime_list)
+    
+    next_cursor = None
+    if len(anime_list) > page_size:
+        anime_list = anime_list[:page_size]
+        next_cursor = encode_cursor(sort_keys[page_size - 1], anime_list[-1]['id'])
+    
+    return dumps_json({'items': anime_list, 'next_cursor': next_cursor})
+
+ANIME_DETAIL_FIELDS = ', '.join(f"'{field}', a.{field}" for field in ANIME_FIELDS)
+
+def fetch_anime_detail(cur, anime_id: Any) -> Optional[str]:
+    # The cursor matches encode_cursor: base64url of json [created_at.isoformat(), id] without padding
+    cur.execute(
+        f"""WITH page AS (
+               SELECT c.id, c.comment_text, c.created_at, u.email
+               FROM t_p29917108_anime_viewer_portal.comments c
+               JOIN t_p29917108_anime_viewer_portal.users u ON c.user_id = u.id
+               WHERE c.anime_id = %(anime_id)s
+               ORDER BY c.created_at DESC, c.id DESC
+               LIMIT %(limit)s + 1
+           )
+           SELECT json_build_object(
+               {ANIME_DETAIL_FIELDS},
+               'comments', COALESCE((
+                   SELECT json_agg(json_build_object('id', p.id, 'comment_text', p.comment_text, 'created_at', p.created_at, 'email', p.email)
+                                   ORDER BY p.created_at DESC, p.id DESC)
+                   FROM (SELECT * FROM page ORDER BY created_at DESC, id DESC LIMIT %(limit)s) p
+               ), '[]'::json),
+               'comments_total', CASE WHEN (SELECT COUNT(*) FROM page) > %(limit)s
+                   THEN (SELECT COUNT(*) FROM t_p29917108_anime_viewer_portal.comments WHERE anime_id = a.id)
+                   ELSE (SELECT COUNT(*) FROM page) END,
+               'comments_next_cursor', (
+                   SELECT rtrim(translate(encode(convert_to(json_build_array(
+                              to_char(p.created_at, 'YYYY-MM-DD"T"HH24:MI:SS')
+                              || CASE WHEN date_trunc('second', p.created_at) <> p.created_at THEN to_char(p.created_at, '.US') ELSE '' END,
+                              p.id)::text, 'UTF8'), 'base64'), E'+/\\n', '-_'), '=')
+                   FROM page p
+                   WHERE (SELECT COUNT(*) FROM page) > %(limit)s
+                   ORDER BY p.created_at DESC, p.id DESC
+                   OFFSET %(limit)s - 1 LIMIT 1
+               ),
+               'rating_histogram', (
+                   SELECT json_agg(COALESCE(h.votes, 0) ORDER BY s.score)
+                   FROM generate_series(1, 10) s(score)
+                   LEFT JOIN (
+                       SELECT rating, COUNT(*) AS votes
+                       FROM t_p29917108_anime_viewer_portal.ratings
+                       WHERE anime_id = a.id
+                       GROUP BY rating
+                   ) h ON h.rating = s.score
+               )
+           )::text AS body
+           FROM t_p29917108_anime_viewer_portal.anime a
+           WHERE a.id = %(anime_id)s""",
+        {'anime_id': anime_id, 'limit': DETAIL_COMMENTS_LIMIT}
+    )
+    row = cur.fetchone()
+    return row['body'] if row else None
+
+def parse_id_list(raw: Any) -> Tuple[Optional[List[int]], Optional[str]]:
+    values = raw.split(',') if isinstance(raw, str) else raw
+    if not isinstance(values, list):
+        return None, 'ids must be a comma-separated string or a JSON array of anime ids'
+    
+    ids: List[int] = []
+    for value in values:
+        anime_id = None
+        if isinstance(value, str):
+            value = value.strip()
+            try:
+                anime_id = int(value)
+            except ValueError:
+                pass
+        elif isinstance(value, int) and not isinstance(value, bool):
+            anime_id = value
+        if anime_id is None or not 0 < anime_id <= INT4_MAX:
+            return None, f"Invalid anime id '{value}'"
+        ids.append(anime_id)
+    
+    ids = list(dict.fromkeys(ids))
+    if not ids or len(ids) > BATCH_MAX_IDS:
+        return None, f'Expected between 1 and {BATCH_MAX_IDS} anime ids'
+    return ids, None
+
+def fetch_anime_batch(cur, ids: List[int], columns: str) -> str:
+    cur.execute(f"SELECT {columns} FROM t_p29917108_anime_viewer_portal.anime WHERE id = ANY(%s)", (ids,))
+    found = {row['id']: row for row in cur.fetchall()}
+    return dumps_json({
+        'items': [found[anime_id] for anime_id in ids if anime_id in found],
+        'missing': [anime_id for anime_id in ids if anime_id not in found]
+    })
+
+def catalog_filter_conditions(filters: Tuple) -> Tuple[str, List[Any]]:
+    anime_type, genre, year = filters[:3]
+    conditions = []
+    params: List[Any] = []
+    for column, value in (('type', anime_type), ('genre', genre), ('year', year)):
+        if value is not None:
+            conditions.append(f"{column} = %s")
+            params.append(value)
+    return ' AND '.join(conditions) or 'TRUE', params
+
+_random_id_cache: OrderedDict = OrderedDict()
+_random_id_cache_lock = threading.Lock()
+
+def load_random_candidates(cur, filters: Tuple, title_count: int, force: bool) -> array:
+    key = filters[:3]
+    with _random_id_cache_lock:
+        entry = _random_id_cache.get(key)
+        if not force and entry is not None and entry[0] > time.monotonic() and entry[1] == title_count:
+            _random_id_cache.move_to_end(key)
+            return entry[2]
+    
+    where, params = catalog_filter_conditions(filters)
+    cur.execute(f"SELECT id FROM t_p29917108_anime_viewer_portal.anime WHERE {where}", params)
+    ids = array('q', (row['id'] for row in cur.fetchall()))
+    with _random_id_cache_lock:
+        _random_id_cache[key] = (time.monotonic() + RANDOM_ID_CACHE_TTL, title_count, ids)
+        _random_id_cache.move_to_end(key)
+        while len(_random_id_cache) > RANDOM_ID_CACHE_MAX_ENTRIES:
+            _random_id_cache.popitem(last=False)
+    return ids
+
+def pick_random_title(cur, filters: Tuple, columns: str) -> Optional[Dict[str, Any]]:
+    where, params = catalog_filter_conditions(filters)
+    cur.execute(f"SELECT COALESCE(SUM(title_count), 0)::int AS total FROM t_p29917108_anime_viewer_portal.anime_facets WHERE {where}", params)
+    title_count = cur.fetchone()['total']
+    if not title_count:
+        return None
+    
+    for attempt in range(2):
+        ids = load_random_candidates(cur, filters, title_count, force=attempt > 0)
+        if not ids:
+            return None
+        cur.execute(
+            f"SELECT {columns} FROM t_p29917108_anime_viewer_portal.anime WHERE id = %s AND {where}",
+            [ids[random.randrange(len(ids))]] + params
+        )
+        row = cur.fetchone()
+        if row:
+            return row
+    return None
+
+def fetch_ranking(cur, ranking: str, page_size: int, after_rank: int) -> Tuple[List[Dict[str, Any]], bool]:
+    cur.execute(
+        f"""SELECT s.refreshed_at < LOCALTIMESTAMP - make_interval(secs => %s) AS stale, r.* 
+           FROM t_p29917108_anime_viewer_portal.anime_rankings_state s 
+           LEFT JOIN LATERAL (
+               SELECT * FROM t_p29917108_anime_viewer_portal.{RANKINGS[ranking]} 
+               WHERE rank > %s ORDER BY rank LIMIT %s
+           ) r ON true 
+           WHERE s.id = 1""",
+        (RANKINGS_REFRESH_INTERVAL, after_rank, page_size + 1)
+    )
+    rows = cur.fetchall()
+    stale = bool(rows and rows[0]['stale'])
+    items = [{key: value for key, value in row.items() if key != 'stale'} for row in rows if row['id'] is not None]
+    return items, stale
+
+def refresh_rankings(cur) -> bool:
+    cur.execute("SELECT t_p29917108_anime_viewer_portal.refresh_anime_rankings() AS refreshed")
+    return bool(cur.fetchone()['refreshed'])
+
+def export_catalog(conn, updated_since: Optional[str], position: Optional[Tuple[Any, int]], compress: bool) -> Tuple[bytes, int, Optional[str]]:
+    conditions = []
+    params: List[Any] = []
+    if updated_since:
+        # Votes leave the indexed updated_at alone; titles whose aggregates changed are found through their ratings rows
+        conditions.append(
+            "(updated_at > %s OR id IN (SELECT anime_id FROM t_p29917108_anime_viewer_portal.ratings WHERE created_at > %s))"
+        )
+        params.extend([updated_since, updated_since])
+    if position:
+        conditions.append("(updated_at, id) > (%s, %s)")
+        params.extend(position)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+    
+    buffer = io.BytesIO()
+    sink = gzip.GzipFile(fileobj=buffer, mode='wb', compresslevel=GZIP_LEVEL, mtime=0) if compress else buffer
+    exported = 0
+    last_row = None
+    has_more = False
+    
+    export_cur = conn.cursor(name='anime_export', cursor_factory=extras.RealDictCursor)
+    export_cur.itersize = EXPORT_ITERSIZE
+    try:
+        with timed_phase('export'):
+            export_cur.execute(
+                f"""SELECT {ANIME_COLUMNS}, rating_sum FROM t_p29917108_anime_viewer_portal.anime 
+                   {where} 
+                   ORDER BY updated_at, id 
+                   LIMIT %s""",
+                params + [EXPORT_MAX_ROWS + 1]
+            )
+            for row in export_cur:
+                if exported == EXPORT_MAX_ROWS:
+                    has_more = True
+                    break
+                sink.write(dumps_json(row).encode('utf-8'))
+                sink.write(b'\n')
+                last_row = row
+                exported += 1
+    finally:
+        export_cur.close()
+    
+    if compress:
+        sink.close()
+    next_cursor = encode_cursor(last_row['updated_at'], last_row['id']) if has_more else None
+    return buffer.getvalue(), exported, next_cursor
+
+def parse_import_payload(event: Dict[str, Any]) -> Tuple[Optional[List[Any]], Optional[str]]:
+    raw = event.get('body') or ''
+    if event.get('isBase64Encoded'):
+        try:
+            raw = base64.b64decode(raw, validate=True).decode('utf-8')
+        except ValueError:
+            return None, 'Body is not valid base64-encoded UTF-8'
+    raw = raw.strip()
+    
+    if raw.startswith('['):
+        try:
+            rows = json.loads(raw)
+        except ValueError as e:
+            return None, f'Invalid JSON array: {e}'
+        return rows, None
+    
+    rows = []
+    for line_number, line in enumerate(raw.splitlines(), start=1):
+        if not line.strip():
+            continue
+        try:
+            rows.append(json.loads(line))
+        except ValueError:
+            rows.append(ValueError(f'Invalid JSON on line {line_number}'))
+    return rows, None
+
+def parse_import_int(value: Any) -> Optional[int]:
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, float):
+        return int(value) if value.is_integer() else None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+def validate_import_row(row: Any) -> Tuple[Optional[Tuple], Optional[str]]:
+    if isinstance(row, ValueError):
+        return None, str(row)
+    if not isinstance(row, dict):
+        return None, 'Row must be an object'
+    
+    external_id = row.get('external_id')
+    if external_id is None or str(external_id).strip() == '':
+        return None, 'external_id is required'
+    if len(str(external_id).strip()) > 255:
+        return None, 'external_id is longer than 255 characters'
+    
+    title = row.get('title')
+    if not isinstance(title, str) or not title.strip() or len(title) > 255:
+        return None, 'title is required (max 255 characters)'
+    
+    if row.get('type') not in ('series', 'movie'):
+        return None, "type must be 'series' or 'movie'"
+    
+    genre = row.get('genre')
+    if not isinstance(genre, str) or not genre.strip() or len(genre) > 100:
+        return None, 'genre is required (max 100 characters)'
+    
+    year = parse_import_int(row.get('year'))
+    episodes = parse_import_int(row.get('episodes', 1))
+    if year is None or episodes is None:
+        return None, 'year and episodes must be integers'
+    if not -INT4_MAX <= year <= INT4_MAX or not 1 <= episodes <= INT4_MAX:
+        return None, f'year must fit in a 32-bit integer and episodes must be between 1 and {INT4_MAX}'
+    
+    for field in ('description', 'thumbnail_url', 'video_url', 'music_url'):
+        if row.get(field) is not None and not isinstance(row.get(field), str):
+            return None, f'{field} must be a string'
+    for field in ('thumbnail_url', 'video_url', 'music_url'):
+        if len(row.get(field) or '') > IMPORT_URL_MAX_LENGTH:
+            return None, f'{field} is longer than {IMPORT_URL_MAX_LENGTH} characters'
+    for field in ('external_id', 'title', 'description', 'genre', 'thumbnail_url', 'video_url', 'music_url'):
+        if '\x00' in str(row.get(field) or ''):
+            return None, f'{field} must not contain NUL characters'
+    
+    return (
+        str(external_id).strip(),
+        title.strip(),
+        row.get('description') or '',
+        row['type'],
+        genre.strip(),
+        year,
+        episodes,
+        row.get('thumbnail_url') or '',
+        row.get('video_url'),
+        row.get('music_url')
+    ), None
+
+def import_anime(cur, rows: List[Any], admin_id: int) -> Dict[str, Any]:
+    valid_rows: Dict[str, Tuple] = {}
+    errors = []
+    
+    for index, row in enumerate(rows):
+        values, error = validate_import_row(row)
+        if error:
+            errors.append({
+                'row': index,
+                'external_id': row.get('external_id') if isinstance(row, dict) else None,
+                'error': error
+            })
+            continue
+        valid_rows[values[0]] = values
+    
+    result = {'received': len(rows), 'inserted': 0, 'updated': 0, 'failed': len(errors), 'errors': errors}
+    if not valid_rows:
+        return result
+    
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for values in valid_rows.values():
+        writer.writerow(['\\N' if value is None else value for value in values])
+    buffer.seek(0)
+    
+    cur.execute(
+        """CREATE TEMP TABLE anime_import_staging (
+               external_id TEXT, title TEXT, description TEXT, type TEXT, genre TEXT, 
+               year INTEGER, episodes INTEGER, thumbnail_url TEXT, video_url TEXT, music_url TEXT
+           ) ON COMMIT DROP"""
+    )
+    cur.copy_expert(
+        f"COPY anime_import_staging ({', '.join(IMPORT_COLUMNS)}) FROM STDIN WITH (FORMAT csv, NULL '\\N', FORCE_NOT_NULL ({IMPORT_NOT_NULL_COLUMNS}))",
+        buffer
+    )
+    cur.execute(
+        """INSERT INTO t_p29917108_anime_viewer_portal.anime 
+               (external_id, title, description, type, genre, year, episodes, thumbnail_url, video_url, music_url, created_by)
+           SELECT external_id, title, description, type, genre, year, episodes, thumbnail_url, video_url, music_url, %s
+           FROM anime_import_staging
+           ON CONFLICT (external_id) DO UPDATE SET 
+               title = EXCLUDED.title,
+               description = EXCLUDED.description,
+               type = EXCLUDED.type,
+               genre = EXCLUDED.genre,
+               year = EXCLUDED.year,
+               episodes = EXCLUDED.episodes,
+               thumbnail_url = EXCLUDED.thumbnail_url,
+               video_url = EXCLUDED.video_url,
+               music_url = EXCLUDED.music_url,
+               updated_at = CURRENT_TIMESTAMP
+           RETURNING (xmax = 0) AS inserted""",
+        (admin_id,)
+    )
+    outcomes = cur.fetchall()
+    result['inserted'] = sum(1 for outcome in outcomes if outcome['inserted'])
+    result['updated'] = len(outcomes) - result['inserted']
+    return result
+
+def get_catalog_state(cur, anime_id: Any = None) -> Optional[Dict[str, Any]]:
+    if not anime_id:
+        cur.execute("SELECT catalog_version FROM t_p29917108_anime_viewer_portal.catalog_state WHERE id = 1")
+        return cur.fetchone()
+    
+    # Admin edits touch updated_at, votes change rating_sum / rating_count and new comments get a newer id
+    cur.execute(
+        """SELECT s.catalog_version, a.updated_at AS anime_updated_at, a.rating_sum, a.rating_count,
+                  (SELECT c.id FROM t_p29917108_anime_viewer_portal.comments c 
+                   WHERE c.anime_id = a.id ORDER BY c.created_at DESC, c.id DESC LIMIT 1) AS last_comment_id
+           FROM t_p29917108_anime_viewer_portal.catalog_state s
+           LEFT JOIN t_p29917108_anime_viewer_portal.anime a ON a.id = %s
+           WHERE s.id = 1""",
+        (anime_id,)
+    )
+    return cur.fetchone()
+
+def bump_catalog_version(cur):
+    cur.execute("UPDATE t_p29917108_anime_viewer_portal.catalog_state SET catalog_version = catalog_version + 1, updated_at = CURRENT_TIMESTAMP WHERE id = 1")
+
+def build_catalog_etag(state: Optional[Dict[str, Any]], query_params: Dict[str, Any]) -> str:
+    versions = str(state['catalog_version']) if state else '0'
+    if state and query_params.get('id'):
+        versions += f":{state['anime_updated_at']}:{state['rating_sum']}:{state['rating_count']}:{state['last_comment_id']}"
+    else:
+        # Rating changes do not bump catalog_version, so list ETags roll over every CATALOG_CACHE_TTL
+        versions += f':{int(time.time() // max(CATALOG_CACHE_TTL, 1))}'
+    normalized = '&'.join(f'{key}={value}' for key, value in sorted(query_params.items()))
+    return '"' + hashlib.sha1(f'{versions}|{normalized}'.encode('utf-8')).hexdigest() + '"'
+
+def etag_matches(event: Dict[str, Any], etag: str) -> bool:
+    headers = event.get('headers') or {}
+    if_none_match = headers.get('If-None-Match') or headers.get('if-none-match')
+    if not if_none_match:
+        return False
+    candidates = [value.strip() for value in if_none_match.split(',')]
+    return '*' in candidates or etag in candidates or f'W/{etag}' in candidates
+
+PREFLIGHT_RESPONSE = build_preflight_response('GET, POST, PUT, DELETE, OPTIONS', 'Content-Type, X-Auth-Token, If-None-Match')
+
+def handle_request(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    method: str = event.get('httpMethod', 'GET')
     
-    db_url = os.environ.get('DATABASE_URL')
     jwt_secret = os.environ.get('JWT_SECRET', 'default-secret-change-me')
     
-    conn = psycopg2.connect(db_url)
-    cur = conn.cursor(cursor_factory=RealDictCursor)
+    with timed_phase('connect'):
+        conn = get_db_connection()
+    cur = conn.cursor(cursor_factory=timed_cursor_factory())
     
-    if method == 'GET':
-        query_params = event.get('queryStringParameters') or {}
-        anime_type = query_params.get('type')
-        genre = query_params.get('genre')
-        year = query_params.get('year')
-        search = query_params.get('search')
-        anime_id = query_params.get('id')
-        
-        if anime_id:
-            cur.execute("SELECT * FROM t_p29917108_anime_viewer_portal.anime WHERE id = %s", (anime_id,))
-            anime = cur.fetchone()
+    try:
+        if method == 'GET':
+            query_params = event.get('queryStringParameters') or {}
+            anime_id = query_params.get('id')
             
-            if anime:
-                cur.execute(
-                    "SELECT c.id, c.comment_text, c.created_at, u.email FROM t_p29917108_anime_viewer_portal.comments c JOIN t_p29917108_anime_viewer_portal.users u ON c.user_id = u.id WHERE c.anime_id = %s ORDER BY c.created_at DESC",
-                    (anime_id,)
-                )
-                comments = cur.fetchall()
+            if query_params.get('stats') == 'cache':
+                token = event.get('headers', {}).get('X-Auth-Token') or event.get('headers', {}).get('x-auth-token')
+                if not verify_admin(token, jwt_secret):
+                    return {
+                        'statusCode': 403,
+                        'headers': {
+                            'Content-Type': 'application/json',
+                            'Access-Control-Allow-Origin': '*'
+                        },
+                        'body': json.dumps({'error': 'Admin access required'}),
+                        'isBase64Encoded': False
+                    }
+                
+                return {
+                    'statusCode': 200,
+                    'headers': {
+                        'Content-Type': 'application/json',
+                        'Cache-Control': 'no-store',
+                        'Access-Control-Allow-Origin': '*'
+                    },
+                    'body': json.dumps(get_catalog_cache_stats()),
+                    'isBase64Encoded': False
+                }
+            
+            if query_params.get('random'):
+                columns, projection_error = resolve_projection(query_params)
+                filters, filters_error = normalize_catalog_filters(query_params)
+                if projection_error or filters_error:
+                    return {
+                        'statusCode': 400,
+                        'headers': {
+                            'Content-Type': 'application/json',
+                            'Access-Control-Allow-Origin': '*'
+                        },
+                        'body': json.dumps({'error': projection_error or filters_error}),
+                        'isBase64Encoded': False
+                    }
                 
-                result = dict(anime)
-                result['comments'] = [dict(c) for c in comments]
+                title = pick_random_title(cur, filters, columns)
+                return {
+                    'statusCode': 200 if title else 404,
+                    'headers': {
+                        'Content-Type': 'application/json',
+                        'Cache-Control': 'no-store',
+                        'Access-Control-Allow-Origin': '*'
+                    },
+                    'body': dumps_json(title) if title else json.dumps({'error': 'No anime matches the filters'}),
+                    'isBase64Encoded': False
+                }
+            
+            ranking = query_params.get('ranking')
+            if ranking:
+                cursor = query_params.get('cursor')
+                position = decode_cursor(cursor, int) if cursor else None
+                page_size = parse_page_limit(query_params.get('limit'))
+                if ranking not in RANKINGS or (cursor and position is None) or page_size is None:
+                    return {
+                        'statusCode': 400,
+                        'headers': {
+                            'Content-Type': 'application/json',
+                            'Access-Control-Allow-Origin': '*'
+                        },
+                        'body': json.dumps({'error': f"Expected ranking in ({', '.join(RANKINGS)}), a valid cursor and limit"}),
+                        'isBase64Encoded': False
+                    }
                 
-                cur.close()
-                conn.close()
+                items, stale = fetch_ranking(cur, ranking, page_size, position[0] if position else 0)
+                next_cursor = None
+                if len(items) > page_size:
+                    items = items[:page_size]
+                    next_cursor = encode_cursor(items[-1]['rank'], items[-1]['id'])
                 
                 return {
                     'statusCode': 200,
                     'headers': {
                         'Content-Type': 'application/json',
+                        'Cache-Control': RANKINGS_CACHE_CONTROL,
                         'Access-Control-Allow-Origin': '*'
                     },
-                    'body': json.dumps(result, default=str),
+                    'body': dumps_json({'items': items, 'next_cursor': next_cursor, 'stale': stale}),
                     'isBase64Encoded': False
                 }
-        
-        query = "SELECT * FROM t_p29917108_anime_viewer_portal.anime WHERE 1=1"
-        params = []
-        
-        if anime_type and anime_type != 'all':
-            query += " AND type = %s"
-            params.append(anime_type)
-        
-        if genre and genre != 'Все':
-            query += " AND genre = %s"
-            params.append(genre)
-        
-        if year and year != 'Все':
-            query += " AND year = %s"
-            params.append(int(year))
-        
-        if search:
-            query += " AND title ILIKE %s"
-            params.append(f'%{search}%')
-        
-        query += " ORDER BY created_at DESC"
-        
-        cur.execute(query, params)
-        anime_list = cur.fetchall()
-        
-        cur.close()
-        conn.close()
-        
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps([dict(a) for a in anime_list], default=str),
-            'isBase64Encoded': False
-        }
-    
-    elif method == 'POST':
-        token = event.get('headers', {}).get('X-Auth-Token') or event.get('headers', {}).get('x-auth-token')
-        admin = verify_admin(token, jwt_secret)
-        
-        if not admin:
-            cur.close()
-            conn.close()
-            return {
-                'statusCode': 403,
+            
+            if query_params.get('export') == 'ndjson':
+                updated_since = query_params.get('updated_since')
+                cursor = query_params.get('cursor')
+                position = decode_cursor(cursor) if cursor else None
+                export_error = None
+                if cursor and position is None:
+                    export_error = 'Invalid cursor'
+                elif updated_since:
+                    try:
+                        datetime.fromisoformat(updated_since)
+                    except ValueError:
+                        export_error = 'updated_since must be an ISO 8601 timestamp'
+                if export_error:
+                    return {
+                        'statusCode': 400,
+                        'headers': {
+                            'Content-Type': 'application/json',
+                            'Access-Control-Allow-Origin': '*'
+                        },
+                        'body': json.dumps({'error': export_error}),
+                        'isBase64Encoded': False
+                    }
+                
+                compress = negotiate_encoding(event, allow_brotli=False) == 'gzip'
+                payload, exported, next_cursor = export_catalog(conn, updated_since, position, compress)
+                headers = {
+                    'Content-Type': 'application/x-ndjson; charset=utf-8',
+                    'Cache-Control': 'no-store',
+                    'X-Export-Rows': str(exported),
+                    'Access-Control-Allow-Origin': '*',
+                    'Access-Control-Expose-Headers': 'X-Export-Rows, X-Next-Cursor'
+                }
+                if next_cursor:
+                    headers['X-Next-Cursor'] = next_cursor
+                if compress:
+                    headers['Content-Encoding'] = 'gzip'
+                    headers['Vary'] = 'Accept-Encoding'
+                return {
+                    'statusCode': 200,
+                    'headers': headers,
+                    'body': base64.b64encode(payload).decode('ascii') if compress else payload.decode('utf-8'),
+                    'isBase64Encoded': compress
+                }
+            
+            catalog_state = get_catalog_state(cur, anime_id)
+            etag = build_catalog_etag(catalog_state, query_params)
+            # Detail and ids bodies are re-read right after a vote or comment, so shared caches must revalidate them
+            cache_control = DETAIL_CACHE_CONTROL if anime_id or query_params.get('ids') else CATALOG_CACHE_CONTROL
+            if etag_matches(event, etag):
+                return {
+                    'statusCode': 304,
+                    'headers': {
+                        'ETag': etag,
+                        'Cache-Control': cache_control,
+                        'Access-Control-Allow-Origin': '*'
+                    },
+                    'body': '',
+                    'isBase64Encoded': False
+                }
+            
+            if query_params.get('ids'):
+                ids, ids_error = parse_id_list(query_params['ids'])
+                columns, projection_error = resolve_projection(query_params)
+                if ids_error or projection_error:
+                    return {
+                        'statusCode': 400,
+                        'headers': {
+                            'Content-Type': 'application/json',
+                            'Access-Control-Allow-Origin': '*'
+                        },
+                        'body': json.dumps({'error': ids_error or projection_error}),
+                        'isBase64Encoded': False
+                    }
+                
+                return {
+                    'statusCode': 200,
+                    'headers': {
+                        'Content-Type': 'application/json',
+                        'ETag': etag,
+                        'Cache-Control': DETAIL_CACHE_CONTROL,
+                        'Access-Control-Allow-Origin': '*'
+                    },
+                    'body': fetch_anime_batch(cur, ids, columns),
+                    'isBase64Encoded': False
+                }
+            
+            if anime_id:
+                detail = fetch_anime_detail(cur, anime_id)
+                
+                if detail:
+                    return {
+                        'statusCode': 200,
+                        'headers': {
+                            'Content-Type': 'application/json',
+                            'ETag': etag,
+                            'Cache-Control': DETAIL_CACHE_CONTROL,
+                            'Access-Control-Allow-Origin': '*'
+                        },
+                        'body': detail,
+                        'isBase64Encoded': False
+                    }
+            
+            filters, filters_error = normalize_catalog_filters(query_params)
+            if filters_error:
+                return {
+                    'statusCode': 400,
+                    'headers': {
+                        'Content-Type': 'application/json',
+                        'Access-Control-Allow-Origin': '*'
+                    },
+                    'body': json.dumps({'error': filters_error}),
+                    'isBase64Encoded': False
+                }
+            if query_params.get('facets'):
+                cache_key = ('facets', catalog_state['catalog_version'] if catalog_state else 0, filters[:3])
+                cached = catalog_cache_get(cache_key)
+                cache_status = 'HIT'
+                if cached is None:
+                    body = fetch_facets(cur, filters)
+                    variants = catalog_cache_put(cache_key, body)
+                    cache_status = 'MISS'
+                else:
+                    body, variants = cached
+                
+                return compress_response(event, {
+                    'statusCode': 200,
+                    'headers': {
+                        'Content-Type': 'application/json',
+                        'ETag': etag,
+                        'Cache-Control': CATALOG_CACHE_CONTROL,
+                        'X-Cache': cache_status,
+                        'Access-Control-Allow-Origin': '*'
+                    },
+                    'body': body,
+                    'isBase64Encoded': False
+                }, variants)
+            
+            columns, projection_error = resolve_projection(query_params)
+            if projection_error:
+                return {
+                    'statusCode': 400,
+                    'headers': {
+                        'Content-Type': 'application/json',
+                        'Access-Control-Allow-Origin': '*'
+                    },
+                    'body': json.dumps({'error': projection_error}),
+                    'isBase64Encoded': False
+                }
+            
+            limit = query_params.get('limit')
+            cursor = query_params.get('cursor')
+            page_size = None
+            position = None
+            
+            if limit is not None or cursor is not None:
+                page_size = parse_page_limit(limit)
+                if not page_size:
+                    return {
+                        'statusCode': 400,
+                        'headers': {
+                            'Content-Type': 'application/json',
+                            'Access-Control-Allow-Origin': '*'
+                        },
+                        'body': json.dumps({'error': 'limit must be a positive integer'}),
+                        'isBase64Encoded': False
+                    }
+            
+            if cursor:
+                position = decode_cursor(cursor, float if filters[3] else datetime)
+                if not position:
+                    return {
+                        'statusCode': 400,
+                        'headers': {
+                            'Content-Type': 'application/json',
+                            'Access-Control-Allow-Origin': '*'
+                        },
+                        'body': json.dumps({'error': 'Invalid cursor'}),
+                        'isBase64Encoded': False
+                    }
+            
+            cache_key = (catalog_state['catalog_version'] if catalog_state else 0, filters, columns, page_size, cursor)
+            cached = catalog_cache_get(cache_key)
+            cache_status = 'HIT'
+            if cached is None:
+                body = fetch_catalog(cur, filters, columns, page_size, position)
+                variants = catalog_cache_put(cache_key, body)
+                cache_status = 'MISS'
+            else:
+                body, variants = cached
+            
+            return compress_response(event, {
+                'statusCode': 200,
                 'headers': {
                     'Content-Type': 'application/json',
+                    'ETag': etag,
+                    'Cache-Control': CATALOG_CACHE_CONTROL,
+                    'X-Cache': cache_status,
                     'Access-Control-Allow-Origin': '*'
                 },
-                'body': json.dumps({'error': 'Admin access required'}),
+                'body': body,
                 'isBase64Encoded': False
-            }
+            }, variants)
         
-        body = json.loads(event.get('body', '{}'))
-        
-        cur.execute(
-            """INSERT INTO t_p29917108_anime_viewer_portal.anime (title, description, type, genre, year, episodes, thumbnail_url, created_by) 
-               VALUES (%s, %s, %s, %s, %s, %s, %s, %s) RETURNING *""",
-            (
-                body.get('title'),
-                body.get('description', ''),
-                body.get('type'),
-                body.get('genre'),
-                body.get('year'),
-                body.get('episodes', 1),
-                body.get('thumbnail_url', ''),
-                admin['user_id']
+        elif method == 'POST':
+            query_params = event.get('queryStringParameters') or {}
+            if query_params.get('action') == 'batch':
+                try:
+                    body = json.loads(event.get('body') or '{}')
+                except ValueError:
+                    body = None
+                if not isinstance(body, dict):
+                    body = {}
+                fields = body.get('fields') or query_params.get('fields')
+                ids, ids_error = parse_id_list(body.get('ids'))
+                columns, projection_error = resolve_projection({
+                    'view': body.get('view') or query_params.get('view'),
+                    'fields': ','.join(map(str, fields)) if isinstance(fields, list) else fields
+                })
+                if ids_error or projection_error:
+                    return {
+                        'statusCode': 400,
+                        'headers': {
+                            'Content-Type': 'application/json',
+                            'Access-Control-Allow-Origin': '*'
+                        },
+                        'body': json.dumps({'error': ids_error or projection_error}),
+                        'isBase64Encoded': False
+                    }
+                
+                return {
+                    'statusCode': 200,
+                    'headers': {
+                        'Content-Type': 'application/json',
+                        'Cache-Control': 'no-store',
+                        'Access-Control-Allow-Origin': '*'
+                    },
+                    'body': fetch_anime_batch(cur, ids, columns),
+                    'isBase64Encoded': False
+                }
+            
+            token = event.get('headers', {}).get('X-Auth-Token') or event.get('headers', {}).get('x-auth-token')
+            admin = verify_admin(token, jwt_secret)
+            
+            if not admin:
+                return {
+                    'statusCode': 403,
+                    'headers': {
+                        'Content-Type': 'application/json',
+                        'Access-Control-Allow-Origin': '*'
+                    },
+                    'body': json.dumps({'error': 'Admin access required'}),
+                    'isBase64Encoded': False
+                }
+            
+            if query_params.get('action') == 'refresh_rankings':
+                refreshed = refresh_rankings(cur)
+                conn.commit()
+                return {
+                    'statusCode': 200 if refreshed else 409,
+                    'headers': {
+                        'Content-Type': 'application/json',
+                        'Access-Control-Allow-Origin': '*'
+                    },
+                    'body': json.dumps({'refreshed': refreshed}),
+                    'isBase64Encoded': False
+                }
+            
+            if query_params.get('action') == 'import':
+                rows, parse_error = parse_import_payload(event)
+                if parse_error or not isinstance(rows, list) or len(rows) > IMPORT_MAX_ROWS:
+                    return {
+                        'statusCode': 400,
+                        'headers': {
+                            'Content-Type': 'application/json',
+                            'Access-Control-Allow-Origin': '*'
+                        },
+                        'body': json.dumps({'error': parse_error or f'Expected a JSON array or NDJSON with at most {IMPORT_MAX_ROWS} rows'}),
+                        'isBase64Encoded': False
+                    }
+                
+                result = import_anime(cur, rows, admin['user_id'])
+                bump_catalog_version(cur)
+                conn.commit()
+                invalidate_catalog_cache()
+                
+                return {
+                    'statusCode': 200,
+                    'headers': {
+                        'Content-Type': 'application/json',
+                        'Access-Control-Allow-Origin': '*'
+                    },
+                    'body': json.dumps(result),
+                    'isBase64Encoded': False
+                }
+            
+            body = json.loads(event.get('body', '{}'))
+            
+            cur.execute(
+                f"""INSERT INTO t_p29917108_anime_viewer_portal.anime (title, description, type, genre, year, episodes, thumbnail_url, created_by) 
+                   VALUES (%s, %s, %s, %s, %s, %s, %s, %s) RETURNING {ANIME_COLUMNS}""",
+                (
+                    body.get('title'),
+                    body.get('description', ''),
+                    body.get('type'),
+                    body.get('genre'),
+                    body.get('year'),
+                    body.get('episodes', 1),
+                    body.get('thumbnail_url', ''),
+                    admin['user_id']
+                )
             )
-        )
-        conn.commit()
-        new_anime = cur.fetchone()
-        
-        cur.close()
-        conn.close()
-        
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps(dict(new_anime), default=str),
-            'isBase64Encoded': False
-        }
-    
-    elif method == 'PUT':
-        token = event.get('headers', {}).get('X-Auth-Token') or event.get('headers', {}).get('x-auth-token')
-        admin = verify_admin(token, jwt_secret)
-        
-        if not admin:
-            cur.close()
-            conn.close()
+            new_anime = cur.fetchone()
+            bump_catalog_version(cur)
+            conn.commit()
+            invalidate_catalog_cache()
+            
             return {
-                'statusCode': 403,
+                'statusCode': 200,
                 'headers': {
                     'Content-Type': 'application/json',
                     'Access-Control-Allow-Origin': '*'
                 },
-                'body': json.dumps({'error': 'Admin access required'}),
+                'body': dumps_json(new_anime),
                 'isBase64Encoded': False
             }
         
-        body = json.loads(event.get('body', '{}'))
-        anime_id = body.get('id')
-        
-        cur.execute(
-            """UPDATE t_p29917108_anime_viewer_portal.anime SET title = %s, description = %s, type = %s, genre = %s, 
-               year = %s, episodes = %s, thumbnail_url = %s, updated_at = CURRENT_TIMESTAMP 
-               WHERE id = %s RETURNING *""",
-            (
-                body.get('title'),
-                body.get('description'),
-                body.get('type'),
-                body.get('genre'),
-                body.get('year'),
-                body.get('episodes'),
-                body.get('thumbnail_url'),
-                anime_id
+        elif method == 'PUT':
+            token = event.get('headers', {}).get('X-Auth-Token') or event.get('headers', {}).get('x-auth-token')
+            admin = verify_admin(token, jwt_secret)
+            
+            if not admin:
+                return {
+                    'statusCode': 403,
+                    'headers': {
+                        'Content-Type': 'application/json',
+                        'Access-Control-Allow-Origin': '*'
+                    },
+                    'body': json.dumps({'error': 'Admin access required'}),
+                    'isBase64Encoded': False
+                }
+            
+            body = json.loads(event.get('body', '{}'))
+            anime_id = body.get('id')
+            
+            cur.execute(
+                f"""UPDATE t_p29917108_anime_viewer_portal.anime SET title = %s, description = %s, type = %s, genre = %s, 
+                   year = %s, episodes = %s, thumbnail_url = %s, updated_at = CURRENT_TIMESTAMP 
+                   WHERE id = %s RETURNING {ANIME_COLUMNS}""",
+                (
+                    body.get('title'),
+                    body.get('description'),
+                    body.get('type'),
+                    body.get('genre'),
+                    body.get('year'),
+                    body.get('episodes'),
+                    body.get('thumbnail_url'),
+                    anime_id
+                )
             )
-        )
-        conn.commit()
-        updated_anime = cur.fetchone()
-        
-        cur.close()
-        conn.close()
-        
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps(dict(updated_anime) if updated_anime else {}, default=str),
-            'isBase64Encoded': False
-        }
-    
-    elif method == 'DELETE':
-        token = event.get('headers', {}).get('X-Auth-Token') or event.get('headers', {}).get('x-auth-token')
-        admin = verify_admin(token, jwt_secret)
-        
-        if not admin:
-            cur.close()
-            conn.close()
+            updated_anime = cur.fetchone()
+            bump_catalog_version(cur)
+            conn.commit()
+            invalidate_catalog_cache()
+            
             return {
-                'statusCode': 403,
+                'statusCode': 200,
                 'headers': {
                     'Content-Type': 'application/json',
                     'Access-Control-Allow-Origin': '*'
                 },
-                'body': json.dumps({'error': 'Admin access required'}),
+                'body': dumps_json(updated_anime or {}),
                 'isBase64Encoded': False
             }
         
-        query_params = event.get('queryStringParameters') or {}
-        anime_id = query_params.get('id')
-        
-        if not anime_id:
-            cur.close()
-            conn.close()
+        elif method == 'DELETE':
+            token = event.get('headers', {}).get('X-Auth-Token') or event.get('headers', {}).get('x-auth-token')
+            admin = verify_admin(token, jwt_secret)
+            
+            if not admin:
+                return {
+                    'statusCode': 403,
+                    'headers': {
+                        'Content-Type': 'application/json',
+                        'Access-Control-Allow-Origin': '*'
+                    },
+                    'body': json.dumps({'error': 'Admin access required'}),
+                    'isBase64Encoded': False
+                }
+            
+            query_params = event.get('queryStringParameters') or {}
+            anime_id = query_params.get('id')
+            
+            if not anime_id:
+                return {
+                    'statusCode': 400,
+                    'headers': {
+                        'Content-Type': 'application/json',
+                        'Access-Control-Allow-Origin': '*'
+                    },
+                    'body': json.dumps({'error': 'Anime ID required'}),
+                    'isBase64Encoded': False
+                }
+            
+            cur.execute("DELETE FROM t_p29917108_anime_viewer_portal.anime WHERE id = %s", (anime_id,))
+            bump_catalog_version(cur)
+            conn.commit()
+            invalidate_catalog_cache()
+            
             return {
-                'statusCode': 400,
+                'statusCode': 200,
                 'headers': {
                     'Content-Type': 'application/json',
                     'Access-Control-Allow-Origin': '*'
                 },
-                'body': json.dumps({'error': 'Anime ID required'}),
+                'body': json.dumps({'success': True}),
                 'isBase64Encoded': False
             }
         
-        cur.execute("DELETE FROM t_p29917108_anime_viewer_portal.anime WHERE id = %s", (anime_id,))
-        conn.commit()
-        
-        cur.close()
-        conn.close()
-        
         return {
-            'statusCode': 200,
+            'statusCode': 405,
             'headers': {
                 'Content-Type': 'application/json',
                 'Access-Control-Allow-Origin': '*'
             },
-            'body': json.dumps({'success': True}),
+            'body': json.dumps({'error': 'Method not allowed'}),
             'isBase64Encoded': False
         }
     
-    cur.close()
-    conn.close()
-    
-    return {
-        'statusCode': 405,
-        'headers': {
-            'Content-Type': 'application/json',
-            'Access-Control-Allow-Origin': '*'
-        },
-        'body': json.dumps({'error': 'Method not allowed'}),
-        'isBase64Encoded': False
-    }
\ No newline at end of file
+    finally:
+        cur.close()
+        release_db_connection(conn)
+
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    return run_handler(FUNCTION_NAME, event, context, handle_request, PREFLIGHT_RESPONSE, compress_response)
+
+mark_module_loaded(FUNCTION_NAME)
@@ -7,114 +7,140 @@ Security: Rate limiting, account lockout, SQL injection prevention, XSS protecti
 
 import json
 import os
-import jwt
-import bcrypt
-import re
-import hashlib
+import time
 from datetime import datetime, timedelta
 from typing import Dict, Any, Optional, Tuple
-import psycopg2
-from psycopg2.extras import RealDictCursor
+from runtime import (
+    mark_module_loaded, run_handler, build_preflight_response, timed_phase, timed_cursor_factory,
+    EMAIL_PATTERN, BCRYPT_ROUNDS, psycopg2, jwt, get_db_connection, release_db_connection, decode_token,
+    get_client_ip, get_user_agent, validate_password, hash_password, hash_password_async, verify_password,
+    log_security_event
+)
 
-def get_client_ip(event: Dict[str, Any]) -> str:
-    return event.get('requestContext', {}).get('identity', {}).get('sourceIp', 'unknown')
+FUNCTION_NAME = 'auth'
+MAX_FAILED_LOGIN_ATTEMPTS = 5
+LOCKOUT_MINUTES = 30
+ACCOUNT_STATE_TTL = float(os.environ.get('ACCOUNT_STATE_TTL', '30'))
+ACCOUNT_STATE_CACHE_SIZE = int(os.environ.get('ACCOUNT_STATE_CACHE_SIZE', '4096'))
 
-def get_user_agent(event: Dict[str, Any]) -> str:
-    return event.get('headers', {}).get('User-Agent', 'unknown')
+# is_active per user for ACCOUNT_STATE_TTL seconds, dropped on account_state_changed notifications from users
+_account_state_cache: Dict[int, Tuple[float, bool]] = {}
+_account_listener = None
 
-def log_security_event(cur, user_id: Optional[int], action: str, success: bool, ip: str, user_agent: str, details: str = ''):
+def invalidate_account_state(user_id: Optional[int] = None):
+    if user_id is None:
+        _account_state_cache.clear()
+    else:
+        _account_state_cache.pop(user_id, None)
+
+def drain_account_state_notifications():
+    global _account_listener
     try:
-        cur.execute(
-            "INSERT INTO t_p29917108_anime_viewer_portal.security_logs (user_id, action, success, ip_address, user_agent, details) VALUES (%s, %s, %s, %s, %s, %s)",
-            (user_id, action, success, ip, user_agent, details)
-        )
-    except Exception:
-        pass
+        if _account_listener is None or _account_listener.closed:
+            invalidate_account_state()
+            _account_listener = psycopg2.connect(os.environ.get('DATABASE_URL'))
+            _account_listener.autocommit = True
+            with _account_listener.cursor() as cur:
+                cur.execute('LISTEN account_state_changed')
+        
+        _account_listener.poll()
+        while _account_listener.notifies:
+            notification = _account_listener.notifies.pop(0)
+            invalidate_account_state(int(notification.payload) if notification.payload.isdigit() else None)
+    except psycopg2.Error:
+        invalidate_account_state()
+        if _account_listener is not None and not _account_listener.closed:
+            _account_listener.close()
+        _account_listener = None
 
-def validate_email(email: str) -> bool:
-    pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
-    return bool(re.match(pattern, email)) and len(email) <= 255
+def is_account_active(cur, user_id: int) -> bool:
+    if ACCOUNT_STATE_TTL > 0:
+        drain_account_state_notifications()
+        entry = _account_state_cache.get(user_id)
+        if entry is not None and entry[0] > time.monotonic() and _account_listener is not None:
+            return entry[1]
+    
+    cur.execute("SELECT is_active FROM t_p29917108_anime_viewer_portal.users WHERE id = %s", (user_id,))
+    user_check = cur.fetchone()
+    active = bool(user_check) and bool(user_check.get('is_active', True))
+    
+    if ACCOUNT_STATE_TTL > 0 and _account_listener is not None:
+        if len(_account_state_cache) >= ACCOUNT_STATE_CACHE_SIZE:
+            _account_state_cache.clear()
+        _account_state_cache[user_id] = (time.monotonic() + ACCOUNT_STATE_TTL, active)
+    return active
+
+def bcrypt_cost(password_hash: str) -> Optional[int]:
+    parts = password_hash.split('$')
+    if len(parts) < 4 or not parts[2].isdigit():
+        return None
+    return int(parts[2])
 
-def validate_password(password: str) -> Tuple[bool, str]:
-    if len(password) < 8:
-        return False, "Пароль должен содержать минимум 8 символов"
-    if not re.search(r'[A-Z]', password):
-        return False, "Пароль должен содержать хотя бы одну заглавную букву"
-    if not re.search(r'[a-z]', password):
-        return False, "Пароль должен содержать хотя бы одну строчную букву"
-    if not re.search(r'[0-9]', password):
-        return False, "Пароль должен содержать хотя бы одну цифру"
-    if not re.search(r'[!@#$%^&*(),.?":{}|<>]', password):
-        return False, "Пароль должен содержать хотя бы один спецсимвол"
-    return True, ""
+def needs_rehash(password_hash: str) -> bool:
+    cost = bcrypt_cost(password_hash)
+    return cost is not None and cost < BCRYPT_ROUNDS
 
-def check_account_lockout(cur, email: str) -> Tuple[bool, str]:
+def upgrade_password_hash(cur, user_id: int, password: str, old_hash: str):
+    with timed_phase('bcrypt'):
+        new_hash = hash_password(password)
     cur.execute(
-        "SELECT failed_login_attempts, account_locked_until FROM t_p29917108_anime_viewer_portal.users WHERE email = %s",
-        (email,)
+        "UPDATE t_p29917108_anime_viewer_portal.users SET password_hash = %s WHERE id = %s AND password_hash = %s",
+        (new_hash, user_id, old_hash)
     )
-    user = cur.fetchone()
-    
-    if not user:
-        return False, ""
-    
-    if user['account_locked_until'] and user['account_locked_until'] > datetime.utcnow():
-        remaining = (user['account_locked_until'] - datetime.utcnow()).seconds // 60
-        return True, f"Аккаунт заблокирован. Попробуйте через {remaining} минут"
-    
-    return False, ""
 
-def update_failed_attempts(cur, conn, email: str):
+def validate_email(email: str) -> bool:
+    return bool(EMAIL_PATTERN.match(email)) and len(email) <= 255
+
+def fetch_login_state(cur, email: str) -> Optional[Dict[str, Any]]:
     cur.execute(
-        "UPDATE t_p29917108_anime_viewer_portal.users SET failed_login_attempts = failed_login_attempts + 1, last_failed_login = CURRENT_TIMESTAMP WHERE email = %s",
+        """SELECT id, email, password_hash, role, is_admin, is_active,
+                  (COALESCE(failed_login_attempts, 0) <> 0 OR account_locked_until IS NOT NULL) AS has_failed_attempts,
+                  CASE WHEN account_locked_until > (NOW() AT TIME ZONE 'UTC')
+                       THEN FLOOR(EXTRACT(EPOCH FROM account_locked_until - (NOW() AT TIME ZONE 'UTC')) / 60)::int
+                  END AS lock_minutes_left
+           FROM t_p29917108_anime_viewer_portal.users WHERE email = %s""",
         (email,)
     )
-    
-    cur.execute("SELECT failed_login_attempts FROM t_p29917108_anime_viewer_portal.users WHERE email = %s", (email,))
-    result = cur.fetchone()
-    
-    if result and result['failed_login_attempts'] >= 5:
-        lockout_time = datetime.utcnow() + timedelta(minutes=30)
-        cur.execute(
-            "UPDATE t_p29917108_anime_viewer_portal.users SET account_locked_until = %s WHERE email = %s",
-            (lockout_time, email)
-        )
-    
-    conn.commit()
+    return cur.fetchone()
 
-def reset_failed_attempts(cur, conn, email: str):
+def record_failed_login(cur, user_id: int, ip: str, user_agent: str):
     cur.execute(
-        "UPDATE t_p29917108_anime_viewer_portal.users SET failed_login_attempts = 0, account_locked_until = NULL WHERE email = %s",
-        (email,)
+        """UPDATE t_p29917108_anime_viewer_portal.users SET 
+               failed_login_attempts = COALESCE(failed_login_attempts, 0) + 1,
+               last_failed_login = CURRENT_TIMESTAMP,
+               account_locked_until = CASE 
+                   WHEN COALESCE(failed_login_attempts, 0) + 1 >= %(max_attempts)s 
+                   THEN (NOW() AT TIME ZONE 'UTC') + make_interval(mins => %(lockout_minutes)s) 
+                   ELSE account_locked_until 
+               END
+           WHERE id = %(user_id)s""",
+        {'user_id': user_id, 'max_attempts': MAX_FAILED_LOGIN_ATTEMPTS, 'lockout_minutes': LOCKOUT_MINUTES}
     )
-    conn.commit()
+    log_security_event(user_id, 'login_wrong_password', False, ip, user_agent, '')
+
+def record_successful_login(cur, user: Dict[str, Any], ip: str, user_agent: str):
+    if user['has_failed_attempts']:
+        cur.execute(
+            "UPDATE t_p29917108_anime_viewer_portal.users SET failed_login_attempts = 0, account_locked_until = NULL WHERE id = %s",
+            (user['id'],)
+        )
+    log_security_event(user['id'], 'login_success', True, ip, user_agent, '')
 
 def sanitize_input(text: str) -> str:
     return text.replace('<', '&lt;').replace('>', '&gt;').replace('"', '&quot;').replace("'", '&#x27;')
 
-def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+PREFLIGHT_RESPONSE = build_preflight_response('GET, POST, OPTIONS')
+
+def handle_request(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'GET')
     client_ip = get_client_ip(event)
     user_agent = get_user_agent(event)
     
-    if method == 'OPTIONS':
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-Auth-Token',
-                'Access-Control-Max-Age': '86400'
-            },
-            'body': '',
-            'isBase64Encoded': False
-        }
-    
-    db_url = os.environ.get('DATABASE_URL')
     jwt_secret = os.environ.get('JWT_SECRET', 'default-secret-change-me')
     
-    conn = psycopg2.connect(db_url)
-    cur = conn.cursor(cursor_factory=RealDictCursor)
+    with timed_phase('connect'):
+        conn = get_db_connection()
+    cur = conn.cursor(cursor_factory=timed_cursor_factory())
     
     try:
         if method == 'POST':
@@ -124,8 +150,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             password = body.get('password', '')
             
             if not validate_email(email):
-                log_security_event(cur, None, f'{action}_invalid_email', False, client_ip, user_agent, email)
-                conn.commit()
+                log_security_event(None, f'{action}_invalid_email', False, client_ip, user_agent, email)
                 return {
                     'statusCode': 400,
                     'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
@@ -143,10 +168,12 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                         'isBase64Encoded': False
                     }
                 
+                pending_hash = hash_password_async(password)
+                
                 cur.execute("SELECT id FROM t_p29917108_anime_viewer_portal.users WHERE email = %s", (email,))
                 if cur.fetchone():
-                    log_security_event(cur, None, 'register_duplicate', False, client_ip, user_agent, email)
-                    conn.commit()
+                    pending_hash.cancel()
+                    log_security_event(None, 'register_duplicate', False, client_ip, user_agent, email)
                     return {
                         'statusCode': 400,
                         'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
@@ -154,7 +181,8 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                         'isBase64Encoded': False
                     }
                 
-                password_hash = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+                with timed_phase('bcrypt'):
+                    password_hash = pending_hash.result()
                 
                 cur.execute(
                     "INSERT INTO t_p29917108_anime_viewer_portal.users (email, password_hash, role, is_admin) VALUES (%s, %s, %s, %s) RETURNING id, email, role, is_admin",
@@ -171,8 +199,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     'exp': datetime.utcnow() + timedelta(days=30)
                 }, jwt_secret, algorithm='HS256')
                 
-                log_security_event(cur, user['id'], 'register_success', True, client_ip, user_agent, '')
-                conn.commit()
+                log_security_event(user['id'], 'register_success', True, client_ip, user_agent, '')
                 
                 return {
                     'statusCode': 200,
@@ -182,23 +209,20 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 }
             
             elif action == 'login':
-                locked, lock_msg = check_account_lockout(cur, email)
-                if locked:
-                    log_security_event(cur, None, 'login_locked', False, client_ip, user_agent, email)
-                    conn.commit()
+                conn.autocommit = True
+                user = fetch_login_state(cur, email)
+                
+                if user and user['lock_minutes_left'] is not None:
+                    log_security_event(None, 'login_locked', False, client_ip, user_agent, email)
                     return {
                         'statusCode': 403,
                         'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'body': json.dumps({'error': lock_msg}),
+                        'body': json.dumps({'error': f"Аккаунт заблокирован. Попробуйте через {user['lock_minutes_left']} минут"}),
                         'isBase64Encoded': False
                     }
                 
-                cur.execute("SELECT id, email, password_hash, role, is_admin, is_active FROM t_p29917108_anime_viewer_portal.users WHERE email = %s", (email,))
-                user = cur.fetchone()
-                
                 if not user:
-                    log_security_event(cur, None, 'login_user_not_found', False, client_ip, user_agent, email)
-                    conn.commit()
+                    log_security_event(None, 'login_user_not_found', False, client_ip, user_agent, email)
                     return {
                         'statusCode': 401,
                         'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
@@ -207,8 +231,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     }
                 
                 if not user.get('is_active', True):
-                    log_security_event(cur, user['id'], 'login_inactive', False, client_ip, user_agent, '')
-                    conn.commit()
+                    log_security_event(user['id'], 'login_inactive', False, client_ip, user_agent, '')
                     return {
                         'statusCode': 403,
                         'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
@@ -216,10 +239,10 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                         'isBase64Encoded': False
                     }
                 
-                if not bcrypt.checkpw(password.encode('utf-8'), user['password_hash'].encode('utf-8')):
-                    update_failed_attempts(cur, conn, email)
-                    log_security_event(cur, user['id'], 'login_wrong_password', False, client_ip, user_agent, '')
-                    conn.commit()
+                with timed_phase('bcrypt'):
+                    password_ok = verify_password(password, user['password_hash'])
+                if not password_ok:
+                    record_failed_login(cur, user['id'], client_ip, user_agent)
                     return {
                         'statusCode': 401,
                         'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
@@ -227,7 +250,10 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                         'isBase64Encoded': False
                     }
                 
-                reset_failed_attempts(cur, conn, email)
+                record_successful_login(cur, user, client_ip, user_agent)
+                
+                if needs_rehash(user['password_hash']):
+                    upgrade_password_hash(cur, user['id'], password, user['password_hash'])
                 
                 token = jwt.encode({
                     'user_id': user['id'],
@@ -237,9 +263,6 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     'exp': datetime.utcnow() + timedelta(days=30)
                 }, jwt_secret, algorithm='HS256')
                 
-                log_security_event(cur, user['id'], 'login_success', True, client_ip, user_agent, '')
-                conn.commit()
-                
                 return {
                     'statusCode': 200,
                     'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
@@ -267,14 +290,10 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 }
             
             try:
-                payload = jwt.decode(token, jwt_secret, algorithms=['HS256'])
-                
-                cur.execute("SELECT is_active FROM t_p29917108_anime_viewer_portal.users WHERE id = %s", (payload['user_id'],))
-                user_check = cur.fetchone()
+                payload = decode_token(token, jwt_secret)
                 
-                if not user_check or not user_check.get('is_active', True):
-                    log_security_event(cur, payload['user_id'], 'verify_inactive', False, client_ip, user_agent, '')
-                    conn.commit()
+                if not is_account_active(cur, payload['user_id']):
+                    log_security_event(payload['user_id'], 'verify_inactive', False, client_ip, user_agent, '')
                     return {
                         'statusCode': 403,
                         'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
@@ -312,4 +331,9 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     
     finally:
         cur.close()
-        conn.close()
+        release_db_connection(conn)
+
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    return run_handler(FUNCTION_NAME, event, context, handle_request, PREFLIGHT_RESPONSE)
+
+mark_module_loaded(FUNCTION_NAME)
@@ -0,0 +1,500 @@
+'''
+Business: Shared handler runtime - lazy imports, request timing, prebuilt CORS responses, cold-start report,
+      connection pool, JWT claim cache, JSON/compression helpers, bcrypt workers and the security log writer
+Args: imported by index.py; every function directory ships an identical copy because functions deploy separately,
+      scripts/check_runtime_copies.py (npm run check:runtime) fails when the copies drift
+Returns: run_handler wraps a function's handle_request; the other helpers are used inside handlers
+Imports: heavy modules (psycopg2, jwt, bcrypt, orjson, brotli, concurrent.futures) load on first attribute access,
+      so OPTIONS preflights and paths that never touch them skip their import cost
+Timing: TIMING_SAMPLE_RATE of requests get a Server-Timing header (connect, jwt, db, bcrypt, fetch, serialize,
+      compress phases) and one request_timing JSON log line with per-statement durations
+Audit: log_security_event buffers security_logs rows for a background writer that inserts them in batches
+Compression: compress_response gzip/brotli-encodes bodies over COMPRESSION_MIN_BYTES per Accept-Encoding
+Cold start: the first request in a process logs import_report with module init time and each lazy import
+'''
+
+import atexit
+import base64
+import gzip
+import hashlib
+import importlib
+import importlib.util
+import json
+import os
+import random
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+RUNTIME_LOADED_AT = time.perf_counter()
+TIMING_SAMPLE_RATE = float(os.environ.get('TIMING_SAMPLE_RATE', '0'))
+TIMING_MAX_QUERIES = int(os.environ.get('TIMING_MAX_QUERIES', '50'))
+IMPORT_REPORT_ENABLED = os.environ.get('IMPORT_REPORT', 'on') != 'off'
+DB_POOL_MIN_SIZE = int(os.environ.get('DB_POOL_MIN_SIZE', '1'))
+DB_POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', '4'))
+DB_POOL_PING_AFTER = float(os.environ.get('DB_POOL_PING_AFTER', '30'))
+TOKEN_CACHE_SIZE = int(os.environ.get('TOKEN_CACHE_SIZE', '1024'))
+TOKEN_CACHE_DEFAULT_TTL = 300
+COMPRESSION_MIN_BYTES = int(os.environ.get('COMPRESSION_MIN_BYTES', '1024'))
+GZIP_LEVEL = int(os.environ.get('GZIP_LEVEL', '6'))
+BROTLI_QUALITY = int(os.environ.get('BROTLI_QUALITY', '5'))
+BCRYPT_ROUNDS = int(os.environ.get('BCRYPT_ROUNDS', '12'))
+BCRYPT_WORKERS = int(os.environ.get('BCRYPT_WORKERS', '2'))
+SECURITY_LOG_BUFFER_SIZE = int(os.environ.get('SECURITY_LOG_BUFFER_SIZE', '1000'))
+SECURITY_LOG_FLUSH_SIZE = int(os.environ.get('SECURITY_LOG_FLUSH_SIZE', '50'))
+SECURITY_LOG_FLUSH_INTERVAL = float(os.environ.get('SECURITY_LOG_FLUSH_INTERVAL', '1'))
+SECURITY_LOG_OVERFLOW = os.environ.get('SECURITY_LOG_OVERFLOW', 'drop_oldest')
+
+EMAIL_PATTERN = re.compile(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$')
+PASSWORD_UPPERCASE_PATTERN = re.compile(r'[A-Z]')
+PASSWORD_LOWERCASE_PATTERN = re.compile(r'[a-z]')
+PASSWORD_DIGIT_PATTERN = re.compile(r'[0-9]')
+PASSWORD_SPECIAL_PATTERN = re.compile(r'[!@#$%^&*(),.?":{}|<>]')
+
+_import_report: Dict[str, Any] = {'module_init_ms': {}, 'lazy_imports_ms': {}, 'reported': set()}
+
+class LazyModule:
+    def __init__(self, name: str):
+        self.__dict__['_name'] = name
+        self.__dict__['_module'] = None
+    
+    def _load(self):
+        module = self.__dict__['_module']
+        if module is None:
+            started = time.perf_counter()
+            module = importlib.import_module(self.__dict__['_name'])
+            _import_report['lazy_imports_ms'].setdefault(self.__dict__['_name'], round((time.perf_counter() - started) * 1000, 3))
+            self.__dict__['_module'] = module
+        return module
+    
+    def __getattr__(self, attr: str) -> Any:
+        return getattr(self._load(), attr)
+
+def lazy_import(name: str, optional: bool = False) -> Optional[LazyModule]:
+    if optional and importlib.util.find_spec(name) is None:
+        return None
+    return LazyModule(name)
+
+psycopg2 = lazy_import('psycopg2')
+pool = lazy_import('psycopg2.pool')
+extras = lazy_import('psycopg2.extras')
+jwt = lazy_import('jwt')
+bcrypt = lazy_import('bcrypt')
+futures = lazy_import('concurrent.futures')
+orjson = lazy_import('orjson', optional=True)
+brotli = lazy_import('brotli', optional=True)
+
+def mark_module_loaded(function_name: str):
+    _import_report['module_init_ms'][function_name] = round((time.perf_counter() - RUNTIME_LOADED_AT) * 1000, 3)
+
+def report_imports(function_name: str, first_request_ms: float):
+    if not IMPORT_REPORT_ENABLED or function_name in _import_report['reported']:
+        return
+    _import_report['reported'].add(function_name)
+    print(json.dumps({
+        'type': 'import_report',
+        'function': function_name,
+        'module_init_ms': _import_report['module_init_ms'].get(function_name),
+        'first_request_ms': round(first_request_ms, 3),
+        'lazy_imports_ms': dict(_import_report['lazy_imports_ms'])
+    }))
+
+def build_preflight_response(methods: str, headers: str = 'Content-Type, X-Auth-Token') -> Dict[str, Any]:
+    return {
+        'statusCode': 200,
+        'headers': {
+            'Access-Control-Allow-Origin': '*',
+            'Access-Control-Allow-Methods': methods,
+            'Access-Control-Allow-Headers': headers,
+            'Access-Control-Max-Age': '86400'
+        },
+        'body': '',
+        'isBase64Encoded': False
+    }
+
+_db_pool = None
+_db_last_used: Dict[int, float] = {}
+_db_settings: Dict[str, bool] = {'decimal_as_float': False}
+
+def configure_db(decimal_as_float: bool = False):
+    _db_settings['decimal_as_float'] = _db_settings['decimal_as_float'] or decimal_as_float
+
+def is_connection_alive(conn) -> bool:
+    try:
+        with conn.cursor() as cur:
+            cur.execute('SELECT 1')
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+def register_decimal_as_float():
+    extensions = psycopg2.extensions
+    extensions.register_type(extensions.new_type(
+        extensions.DECIMAL.values, 'DECIMAL_AS_FLOAT',
+        lambda value, cur: float(value) if value is not None else None
+    ))
+
+def get_db_connection():
+    global _db_pool
+    if _db_pool is None or _db_pool.closed:
+        if _db_settings['decimal_as_float']:
+            register_decimal_as_float()
+        _db_pool = pool.ThreadedConnectionPool(DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE, os.environ.get('DATABASE_URL'))
+    
+    for _ in range(DB_POOL_MAX_SIZE):
+        conn = _db_pool.getconn()
+        now = time.monotonic()
+        idle_for = now - _db_last_used.get(id(conn), now)
+        if not conn.closed and (idle_for < DB_POOL_PING_AFTER or is_connection_alive(conn)):
+            return conn
+        _db_last_used.pop(id(conn), None)
+        _db_pool.putconn(conn, close=True)
+    
+    return _db_pool.getconn()
+
+def release_db_connection(conn):
+    if not conn.closed:
+        try:
+            conn.rollback()
+        except psycopg2.Error:
+            pass
+    
+    if conn.closed:
+        _db_last_used.pop(id(conn), None)
+        _db_pool.putconn(conn, close=True)
+        return
+    
+    if conn.autocommit:
+        conn.autocommit = False
+    _db_last_used[id(conn)] = time.monotonic()
+    _db_pool.putconn(conn)
+
+def encode_json_value(value: Any) -> Any:
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    return str(value)
+
+_json_encoder = json.JSONEncoder(default=encode_json_value, ensure_ascii=False, separators=(',', ':'))
+
+def dumps_json(payload: Any) -> str:
+    with timed_phase('serialize'):
+        if orjson is not None:
+            return orjson.dumps(payload, default=encode_json_value).decode('utf-8')
+        return _json_encoder.encode(payload)
+
+_token_cache: OrderedDict = OrderedDict()
+_token_cache_lock = threading.Lock()
+
+def decode_token(token: str, jwt_secret: str) -> Dict[str, Any]:
+    key = hashlib.sha256(f'{jwt_secret}\0{token}'.encode('utf-8')).digest()
+    with _token_cache_lock:
+        entry = _token_cache.get(key)
+        if entry is not None:
+            if entry[0] > time.time():
+                _token_cache.move_to_end(key)
+                return entry[1]
+            del _token_cache[key]
+    
+    with timed_phase('jwt'):
+        payload = jwt.decode(token, jwt_secret, algorithms=['HS256'])
+    with _token_cache_lock:
+        _token_cache[key] = (payload.get('exp') or time.time() + TOKEN_CACHE_DEFAULT_TTL, payload)
+        while len(_token_cache) > TOKEN_CACHE_SIZE:
+            _token_cache.popitem(last=False)
+    return payload
+
+def negotiate_encoding(event: Dict[str, Any], allow_brotli: bool = True) -> Optional[str]:
+    headers = event.get('headers') or {}
+    accept_encoding = headers.get('Accept-Encoding') or headers.get('accept-encoding') or ''
+    accepted = set()
+    for part in accept_encoding.split(','):
+        name, _, params = part.strip().partition(';')
+        quality = params.strip()
+        if quality.startswith('q='):
+            try:
+                if float(quality[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.add(name.strip().lower())
+    
+    if allow_brotli and brotli is not None and ('br' in accepted or '*' in accepted):
+        return 'br'
+    if 'gzip' in accepted or '*' in accepted:
+        return 'gzip'
+    return None
+
+def compress_body(body: str, encoding: str) -> bytes:
+    data = body.encode('utf-8')
+    with timed_phase('compress'):
+        if encoding == 'br':
+            return brotli.compress(data, quality=BROTLI_QUALITY)
+        return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+
+def compress_response(event: Dict[str, Any], response: Dict[str, Any], variants: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    body = response.get('body')
+    headers = response.get('headers') or {}
+    if response.get('isBase64Encoded') or 'Content-Encoding' in headers or not isinstance(body, str):
+        return response
+    if len(body) < COMPRESSION_MIN_BYTES:
+        return response
+    
+    headers = {**headers, 'Vary': 'Accept-Encoding'}
+    encoding = negotiate_encoding(event)
+    if encoding is None:
+        return {**response, 'headers': headers}
+    
+    encoded = variants.get(encoding) if variants is not None else None
+    if encoded is None:
+        encoded = base64.b64encode(compress_body(body, encoding)).decode('ascii')
+        if variants is not None:
+            variants[encoding] = encoded
+    
+    headers['Content-Encoding'] = encoding
+    etag = headers.get('ETag')
+    if etag and not etag.startswith('W/'):
+        headers['ETag'] = f'W/{etag}'
+    return {**response, 'headers': headers, 'body': encoded, 'isBase64Encoded': True}
+
+def get_client_ip(event: Dict[str, Any]) -> str:
+    return event.get('requestContext', {}).get('identity', {}).get('sourceIp', 'unknown')
+
+def get_user_agent(event: Dict[str, Any]) -> str:
+    return event.get('headers', {}).get('User-Agent', 'unknown')
+
+def validate_password(password: str) -> Tuple[bool, str]:
+    if len(password) < 8:
+        return False, "Пароль должен содержать минимум 8 символов"
+    if not PASSWORD_UPPERCASE_PATTERN.search(password):
+        return False, "Пароль должен содержать хотя бы одну заглавную букву"
+    if not PASSWORD_LOWERCASE_PATTERN.search(password):
+        return False, "Пароль должен содержать хотя бы одну строчную букву"
+    if not PASSWORD_DIGIT_PATTERN.search(password):
+        return False, "Пароль должен содержать хотя бы одну цифру"
+    if not PASSWORD_SPECIAL_PATTERN.search(password):
+        return False, "Пароль должен содержать хотя бы один спецсимвол"
+    return True, ""
+
+_bcrypt_executor = None
+
+def get_bcrypt_executor():
+    global _bcrypt_executor
+    if _bcrypt_executor is None:
+        _bcrypt_executor = futures.ThreadPoolExecutor(max_workers=BCRYPT_WORKERS, thread_name_prefix='bcrypt')
+    return _bcrypt_executor
+
+def hash_password(password: str) -> str:
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds=BCRYPT_ROUNDS)).decode('utf-8')
+
+def verify_password(password: str, password_hash: str) -> bool:
+    return bcrypt.checkpw(password.encode('utf-8'), password_hash.encode('utf-8'))
+
+def hash_password_async(password: str):
+    return get_bcrypt_executor().submit(hash_password, password)
+
+_security_log_buffer: deque = deque()
+_security_log_condition = threading.Condition()
+_security_log_stats: Dict[str, int] = {'queued': 0, 'written': 0, 'dropped': 0, 'failed_flushes': 0}
+_security_log_unreported_drops = 0
+_security_log_thread: Optional[threading.Thread] = None
+
+def log_security_event(user_id: Optional[int], action: str, success: bool, ip: str, user_agent: str, details: str = ''):
+    global _security_log_unreported_drops
+    event = (user_id, action, success, ip, user_agent, details)
+    with _security_log_condition:
+        if len(_security_log_buffer) >= SECURITY_LOG_BUFFER_SIZE:
+            _security_log_stats['dropped'] += 1
+            _security_log_unreported_drops += 1
+            if SECURITY_LOG_OVERFLOW != 'drop_oldest':
+                return
+            _security_log_buffer.popleft()
+        _security_log_buffer.append(event)
+        _security_log_stats['queued'] += 1
+        if len(_security_log_buffer) >= SECURITY_LOG_FLUSH_SIZE:
+            _security_log_condition.notify()
+    ensure_security_log_writer()
+
+def take_security_log_batch() -> List[Tuple]:
+    global _security_log_unreported_drops
+    with _security_log_condition:
+        batch = [_security_log_buffer.popleft() for _ in range(min(len(_security_log_buffer), SECURITY_LOG_FLUSH_SIZE))]
+        if _security_log_unreported_drops:
+            batch.append((None, 'security_log_dropped', False, 'internal', 'security-log-writer', str(_security_log_unreported_drops)))
+            _security_log_unreported_drops = 0
+    return batch
+
+def requeue_security_log_batch(batch: List[Tuple]):
+    with _security_log_condition:
+        _security_log_stats['failed_flushes'] += 1
+        room = max(SECURITY_LOG_BUFFER_SIZE - len(_security_log_buffer), 0)
+        _security_log_buffer.extendleft(reversed(batch[:room]))
+        _security_log_stats['dropped'] += len(batch) - len(batch[:room])
+
+def flush_security_logs() -> int:
+    written = 0
+    while True:
+        batch = take_security_log_batch()
+        if not batch:
+            return written
+        
+        try:
+            conn = get_db_connection()
+        except psycopg2.Error:
+            requeue_security_log_batch(batch)
+            raise
+        
+        try:
+            with conn.cursor() as cur:
+                extras.execute_values(
+                    cur,
+                    "INSERT INTO t_p29917108_anime_viewer_portal.security_logs (user_id, action, success, ip_address, user_agent, details) VALUES %s",
+                    batch
+                )
+            conn.commit()
+        except psycopg2.Error:
+            requeue_security_log_batch(batch)
+            raise
+        finally:
+            release_db_connection(conn)
+        
+        with _security_log_condition:
+            _security_log_stats['written'] += len(batch)
+        written += len(batch)
+
+def run_security_log_writer():
+    while True:
+        with _security_log_condition:
+            _security_log_condition.wait_for(lambda: len(_security_log_buffer) >= SECURITY_LOG_FLUSH_SIZE, timeout=SECURITY_LOG_FLUSH_INTERVAL)
+        try:
+            flush_security_logs()
+        except Exception:
+            time.sleep(SECURITY_LOG_FLUSH_INTERVAL)
+
+def ensure_security_log_writer():
+    global _security_log_thread
+    if _security_log_thread is None or not _security_log_thread.is_alive():
+        _security_log_thread = threading.Thread(target=run_security_log_writer, name='security-log-writer', daemon=True)
+        _security_log_thread.start()
+
+def flush_security_logs_at_exit():
+    try:
+        flush_security_logs()
+    except Exception:
+        pass
+
+atexit.register(flush_security_logs_at_exit)
+
+_trace = threading.local()
+
+def start_request_trace():
+    if TIMING_SAMPLE_RATE <= 0 or (TIMING_SAMPLE_RATE < 1 and random.random() >= TIMING_SAMPLE_RATE):
+        _trace.current = None
+        return
+    _trace.current = {'started': time.perf_counter(), 'phases': {}, 'queries': [], 'query_count': 0}
+
+@contextmanager
+def timed_phase(name: str):
+    trace = getattr(_trace, 'current', None)
+    if trace is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace['phases'][name] = trace['phases'].get(name, 0.0) + (time.perf_counter() - started) * 1000
+
+def normalize_sql(query: Any) -> str:
+    if isinstance(query, bytes):
+        query = query.decode('utf-8', 'replace')
+    return ' '.join(str(query).split())[:300]
+
+_timed_cursor_class = None
+
+def timed_cursor_factory():
+    global _timed_cursor_class
+    if _timed_cursor_class is not None:
+        return _timed_cursor_class
+    
+    from psycopg2.extras import RealDictCursor
+    
+    class TimedRealDictCursor(RealDictCursor):
+        def execute(self, query, vars=None):
+            trace = getattr(_trace, 'current', None)
+            if trace is None:
+                return super().execute(query, vars)
+            started = time.perf_counter()
+            try:
+                return super().execute(query, vars)
+            finally:
+                elapsed = (time.perf_counter() - started) * 1000
+                trace['phases']['db'] = trace['phases'].get('db', 0.0) + elapsed
+                trace['query_count'] += 1
+                if len(trace['queries']) < TIMING_MAX_QUERIES:
+                    trace['queries'].append({'sql': normalize_sql(query), 'ms': round(elapsed, 3), 'rows': self.rowcount})
+        
+        def fetchone(self):
+            with timed_phase('fetch'):
+                return super().fetchone()
+        
+        def fetchall(self):
+            with timed_phase('fetch'):
+                return super().fetchall()
+    
+    _timed_cursor_class = TimedRealDictCursor
+    return _timed_cursor_class
+
+def finish_request_trace(function_name: str, event: Dict[str, Any], context: Any, response: Dict[str, Any]) -> Dict[str, Any]:
+    trace = getattr(_trace, 'current', None)
+    if trace is None:
+        return response
+    _trace.current = None
+    
+    total = (time.perf_counter() - trace['started']) * 1000
+    phases = {name: round(elapsed, 3) for name, elapsed in trace['phases'].items()}
+    print(json.dumps({
+        'type': 'request_timing',
+        'function': function_name,
+        'request_id': getattr(context, 'request_id', None) or (event.get('requestContext') or {}).get('requestId'),
+        'method': event.get('httpMethod'),
+        'params': sorted((event.get('queryStringParameters') or {}).keys()),
+        'status': response.get('statusCode'),
+        'total_ms': round(total, 3),
+        'phases': phases,
+        'query_count': trace['query_count'],
+        'queries': trace['queries']
+    }, ensure_ascii=False, default=str))
+    
+    server_timing = ', '.join([f'{name};dur={elapsed:.1f}' for name, elapsed in phases.items()] + [f'total;dur={total:.1f}'])
+    headers = {**(response.get('headers') or {}), 'Server-Timing': server_timing, 'Timing-Allow-Origin': '*'}
+    return {**response, 'headers': headers}
+
+def run_handler(
+    function_name: str,
+    event: Dict[str, Any],
+    context: Any,
+    handle_request: Callable[[Dict[str, Any], Any], Dict[str, Any]],
+    preflight_response: Dict[str, Any],
+    postprocess: Optional[Callable[[Dict[str, Any], Dict[str, Any]], Dict[str, Any]]] = None
+) -> Dict[str, Any]:
+    started = time.perf_counter()
+    if event.get('httpMethod') == 'OPTIONS':
+        response = preflight_response
+    else:
+        start_request_trace()
+        response = handle_request(event, context)
+        if postprocess is not None:
+            response = postprocess(event, response)
+        response = finish_request_trace(function_name, event, context, response)
+    
+    if function_name not in _import_report['reported']:
+        report_imports(function_name, (time.perf_counter() - started) * 1000)
+    return response
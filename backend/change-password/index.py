@@ -7,60 +7,22 @@ Security: Validates old password, enforces strong password policy
 
 import json
 import os
-import jwt
-import bcrypt
-import re
-from datetime import datetime
-from typing import Dict, Any, Tuple
-import psycopg2
-from psycopg2.extras import RealDictCursor
+from typing import Dict, Any
+from runtime import (
+    mark_module_loaded, run_handler, build_preflight_response, timed_phase, timed_cursor_factory,
+    jwt, get_db_connection, release_db_connection, get_client_ip, get_user_agent, validate_password,
+    hash_password, verify_password, log_security_event
+)
 
-def get_client_ip(event: Dict[str, Any]) -> str:
-    return event.get('requestContext', {}).get('identity', {}).get('sourceIp', 'unknown')
+FUNCTION_NAME = 'change-password'
 
-def get_user_agent(event: Dict[str, Any]) -> str:
-    return event.get('headers', {}).get('User-Agent', 'unknown')
+PREFLIGHT_RESPONSE = build_preflight_response('POST, OPTIONS')
 
-def log_security_event(cur, user_id: int, action: str, success: bool, ip: str, user_agent: str, details: str = ''):
-    try:
-        cur.execute(
-            "INSERT INTO t_p29917108_anime_viewer_portal.security_logs (user_id, action, success, ip_address, user_agent, details) VALUES (%s, %s, %s, %s, %s, %s)",
-            (user_id, action, success, ip, user_agent, details)
-        )
-    except Exception:
-        pass
-
-def validate_password(password: str) -> Tuple[bool, str]:
-    if len(password) < 8:
-        return False, "Пароль должен содержать минимум 8 символов"
-    if not re.search(r'[A-Z]', password):
-        return False, "Пароль должен содержать хотя бы одну заглавную букву"
-    if not re.search(r'[a-z]', password):
-        return False, "Пароль должен содержать хотя бы одну строчную букву"
-    if not re.search(r'[0-9]', password):
-        return False, "Пароль должен содержать хотя бы одну цифру"
-    if not re.search(r'[!@#$%^&*(),.?":{}|<>]', password):
-        return False, "Пароль должен содержать хотя бы один спецсимвол"
-    return True, ""
-
-def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+def handle_request(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'POST')
     client_ip = get_client_ip(event)
     user_agent = get_user_agent(event)
     
-    if method == 'OPTIONS':
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'POST, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-Auth-Token',
-                'Access-Control-Max-Age': '86400'
-            },
-            'body': '',
-            'isBase64Encoded': False
-        }
-    
     if method != 'POST':
         return {
             'statusCode': 405,
@@ -69,7 +31,6 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'isBase64Encoded': False
         }
     
-    db_url = os.environ.get('DATABASE_URL')
     jwt_secret = os.environ.get('JWT_SECRET', 'default-secret-change-me')
     
     token = event.get('headers', {}).get('X-Auth-Token') or event.get('headers', {}).get('x-auth-token')
@@ -83,7 +44,8 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         }
     
     try:
-        payload = jwt.decode(token, jwt_secret, algorithms=['HS256'])
+        with timed_phase('jwt'):
+            payload = jwt.decode(token, jwt_secret, algorithms=['HS256'])
         user_id = payload.get('user_id')
     except jwt.ExpiredSignatureError:
         return {
@@ -100,8 +62,9 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'isBase64Encoded': False
         }
     
-    conn = psycopg2.connect(db_url)
-    cur = conn.cursor(cursor_factory=RealDictCursor)
+    with timed_phase('connect'):
+        conn = get_db_connection()
+    cur = conn.cursor(cursor_factory=timed_cursor_factory())
     
     try:
         body = json.loads(event.get('body', '{}'))
@@ -125,6 +88,14 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 'isBase64Encoded': False
             }
         
+        if old_password == new_password:
+            return {
+                'statusCode': 400,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': 'Новый пароль должен отличаться от старого'}),
+                'isBase64Encoded': False
+            }
+        
         cur.execute(
             "SELECT id, email, password_hash, is_active FROM t_p29917108_anime_viewer_portal.users WHERE id = %s",
             (user_id,)
@@ -132,8 +103,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         user = cur.fetchone()
         
         if not user:
-            log_security_event(cur, user_id, 'password_change_user_not_found', False, client_ip, user_agent, '')
-            conn.commit()
+            log_security_event(user_id, 'password_change_user_not_found', False, client_ip, user_agent, '')
             return {
                 'statusCode': 404,
                 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
@@ -142,8 +112,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             }
         
         if not user.get('is_active', True):
-            log_security_event(cur, user_id, 'password_change_inactive', False, client_ip, user_agent, '')
-            conn.commit()
+            log_security_event(user_id, 'password_change_inactive', False, client_ip, user_agent, '')
             return {
                 'statusCode': 403,
                 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
@@ -151,9 +120,10 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 'isBase64Encoded': False
             }
         
-        if not bcrypt.checkpw(old_password.encode('utf-8'), user['password_hash'].encode('utf-8')):
-            log_security_event(cur, user_id, 'password_change_wrong_old_password', False, client_ip, user_agent, '')
-            conn.commit()
+        with timed_phase('bcrypt'):
+            old_password_ok = verify_password(old_password, user['password_hash'])
+        if not old_password_ok:
+            log_security_event(user_id, 'password_change_wrong_old_password', False, client_ip, user_agent, '')
             return {
                 'statusCode': 401,
                 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
@@ -161,15 +131,8 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 'isBase64Encoded': False
             }
         
-        if old_password == new_password:
-            return {
-                'statusCode': 400,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'Новый пароль должен отличаться от старого'}),
-                'isBase64Encoded': False
-            }
-        
-        new_password_hash = bcrypt.hashpw(new_password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+        with timed_phase('bcrypt'):
+            new_password_hash = hash_password(new_password)
         
         cur.execute(
             "UPDATE t_p29917108_anime_viewer_portal.users SET password_hash = %s, updated_at = CURRENT_TIMESTAMP WHERE id = %s",
@@ -177,8 +140,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         )
         conn.commit()
         
-        log_security_event(cur, user_id, 'password_change_success', True, client_ip, user_agent, '')
-        conn.commit()
+        log_security_event(user_id, 'password_change_success', True, client_ip, user_agent, '')
         
         return {
             'statusCode': 200,
@@ -189,4 +151,9 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     
     finally:
         cur.close()
-        conn.close()
+        release_db_connection(conn)
+
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    return run_handler(FUNCTION_NAME, event, context, handle_request, PREFLIGHT_RESPONSE)
+
+mark_module_loaded(FUNCTION_NAME)
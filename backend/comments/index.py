@@ -1,155 +1,230 @@
 '''
 Business: Comments management for anime - add and view comments
-Args: event with httpMethod (GET/POST), body (anime_id, comment_text), headers (X-Auth-Token)
+Args: event with httpMethod (GET/POST), body (anime_id, comment_text), headers (X-Auth-Token),
+      queryStringParameters (anime_id, limit, cursor)
 Returns: HTTP response with comments or operation result
 '''
 
 import json
 import os
-import jwt
-from typing import Dict, Any
-import psycopg2
-from psycopg2.extras import RealDictCursor
+import base64
+from datetime import datetime
+from typing import Dict, Any, Optional, Tuple
+from runtime import (
+    mark_module_loaded, run_handler, build_preflight_response, timed_phase, timed_cursor_factory,
+    configure_db, get_db_connection, release_db_connection, decode_token, dumps_json, compress_response
+)
+
+FUNCTION_NAME = 'comments'
+COMMENTS_PAGE_DEFAULT_LIMIT = int(os.environ.get('COMMENTS_PAGE_DEFAULT_LIMIT', '20'))
+COMMENTS_PAGE_MAX_LIMIT = int(os.environ.get('COMMENTS_PAGE_MAX_LIMIT', '100'))
+
+configure_db(decimal_as_float=True)
 
 def get_user_from_token(token: str, jwt_secret: str) -> Dict[str, Any]:
     if not token:
         return None
     
     try:
-        payload = jwt.decode(token, jwt_secret, algorithms=['HS256'])
-        return payload
+        return decode_token(token, jwt_secret)
     except:
         return None
 
-def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+def encode_cursor(created_at: datetime, row_id: int) -> str:
+    raw = json.dumps([created_at.isoformat(), row_id])
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor: str) -> Optional[Tuple[str, int]]:
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        datetime.fromisoformat(created_at)
+        return created_at, int(row_id)
+    except (ValueError, TypeError):
+        return None
+
+def parse_page_limit(limit: Optional[str]) -> Optional[int]:
+    if limit is None or limit == '':
+        return COMMENTS_PAGE_DEFAULT_LIMIT
+    try:
+        value = int(limit)
+    except ValueError:
+        return None
+    if value < 1:
+        return None
+    return min(value, COMMENTS_PAGE_MAX_LIMIT)
+
+PREFLIGHT_RESPONSE = build_preflight_response('GET, POST, OPTIONS')
+
+def handle_request(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'GET')
     
-    if method == 'OPTIONS':
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-Auth-Token',
-                'Access-Control-Max-Age': '86400'
-            },
-            'body': '',
-            'isBase64Encoded': False
-        }
-    
-    db_url = os.environ.get('DATABASE_URL')
     jwt_secret = os.environ.get('JWT_SECRET', 'default-secret-change-me')
     
-    conn = psycopg2.connect(db_url)
-    cur = conn.cursor(cursor_factory=RealDictCursor)
-    
-    if method == 'GET':
-        query_params = event.get('queryStringParameters') or {}
-        anime_id = query_params.get('anime_id')
-        
-        if not anime_id:
-            cur.close()
-            conn.close()
-            return {
-                'statusCode': 400,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'body': json.dumps({'error': 'anime_id required'}),
-                'isBase64Encoded': False
-            }
-        
-        cur.execute(
-            """SELECT c.id, c.comment_text, c.created_at, u.email 
-               FROM comments c 
-               JOIN users u ON c.user_id = u.id 
-               WHERE c.anime_id = %s 
-               ORDER BY c.created_at DESC""",
-            (anime_id,)
-        )
-        comments = cur.fetchall()
-        
-        cur.close()
-        conn.close()
-        
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps([dict(c) for c in comments], default=str),
-            'isBase64Encoded': False
-        }
+    with timed_phase('connect'):
+        conn = get_db_connection()
+    cur = conn.cursor(cursor_factory=timed_cursor_factory())
     
-    elif method == 'POST':
-        token = event.get('headers', {}).get('X-Auth-Token') or event.get('headers', {}).get('x-auth-token')
-        user = get_user_from_token(token, jwt_secret)
-        
-        if not user:
-            cur.close()
-            conn.close()
+    try:
+        if method == 'GET':
+            query_params = event.get('queryStringParameters') or {}
+            anime_id = query_params.get('anime_id')
+            
+            if not anime_id:
+                return {
+                    'statusCode': 400,
+                    'headers': {
+                        'Content-Type': 'application/json',
+                        'Access-Control-Allow-Origin': '*'
+                    },
+                    'body': json.dumps({'error': 'anime_id required'}),
+                    'isBase64Encoded': False
+                }
+            
+            limit = query_params.get('limit')
+            cursor = query_params.get('cursor')
+            
+            if limit is None and cursor is None:
+                cur.execute(
+                    """SELECT c.id, c.comment_text, c.created_at, u.email 
+                       FROM comments c 
+                       JOIN users u ON c.user_id = u.id 
+                       WHERE c.anime_id = %s 
+                       ORDER BY c.created_at DESC, c.id DESC""",
+                    (anime_id,)
+                )
+                comments = cur.fetchall()
+                
+                return {
+                    'statusCode': 200,
+                    'headers': {
+                        'Content-Type': 'application/json',
+                        'Access-Control-Allow-Origin': '*'
+                    },
+                    'body': dumps_json(comments),
+                    'isBase64Encoded': False
+                }
+            
+            page_size = parse_page_limit(limit)
+            if not page_size:
+                return {
+                    'statusCode': 400,
+                    'headers': {
+                        'Content-Type': 'application/json',
+                        'Access-Control-Allow-Origin': '*'
+                    },
+                    'body': json.dumps({'error': 'limit must be a positive integer'}),
+                    'isBase64Encoded': False
+                }
+            
+            query = """SELECT c.id, c.comment_text, c.created_at, u.email 
+                       FROM comments c 
+                       JOIN users u ON c.user_id = u.id 
+                       WHERE c.anime_id = %s"""
+            params = [anime_id]
+            
+            if cursor:
+                position = decode_cursor(cursor)
+                if not position:
+                    return {
+                        'statusCode': 400,
+                        'headers': {
+                            'Content-Type': 'application/json',
+                            'Access-Control-Allow-Origin': '*'
+                        },
+                        'body': json.dumps({'error': 'Invalid cursor'}),
+                        'isBase64Encoded': False
+                    }
+                query += " AND (c.created_at, c.id) < (%s, %s)"
+                params.extend(position)
+            
+            query += " ORDER BY c.created_at DESC, c.id DESC LIMIT %s"
+            params.append(page_size + 1)
+            
+            cur.execute(query, params)
+            comments = cur.fetchall()
+            
+            next_cursor = None
+            if len(comments) > page_size:
+                comments = comments[:page_size]
+                next_cursor = encode_cursor(comments[-1]['created_at'], comments[-1]['id'])
+            
             return {
-                'statusCode': 401,
+                'statusCode': 200,
                 'headers': {
                     'Content-Type': 'application/json',
                     'Access-Control-Allow-Origin': '*'
                 },
-                'body': json.dumps({'error': 'Authentication required'}),
+                'body': dumps_json({'items': comments, 'next_cursor': next_cursor}),
                 'isBase64Encoded': False
             }
         
-        body = json.loads(event.get('body', '{}'))
-        anime_id = body.get('anime_id')
-        comment_text = body.get('comment_text', '')
-        
-        if not anime_id or not comment_text:
-            cur.close()
-            conn.close()
+        elif method == 'POST':
+            token = event.get('headers', {}).get('X-Auth-Token') or event.get('headers', {}).get('x-auth-token')
+            user = get_user_from_token(token, jwt_secret)
+            
+            if not user:
+                return {
+                    'statusCode': 401,
+                    'headers': {
+                        'Content-Type': 'application/json',
+                        'Access-Control-Allow-Origin': '*'
+                    },
+                    'body': json.dumps({'error': 'Authentication required'}),
+                    'isBase64Encoded': False
+                }
+            
+            body = json.loads(event.get('body', '{}'))
+            anime_id = body.get('anime_id')
+            comment_text = body.get('comment_text', '')
+            
+            if not anime_id or not comment_text:
+                return {
+                    'statusCode': 400,
+                    'headers': {
+                        'Content-Type': 'application/json',
+                        'Access-Control-Allow-Origin': '*'
+                    },
+                    'body': json.dumps({'error': 'anime_id and comment_text required'}),
+                    'isBase64Encoded': False
+                }
+            
+            cur.execute(
+                """INSERT INTO comments (anime_id, user_id, comment_text) 
+                   VALUES (%s, %s, %s) RETURNING id, comment_text, created_at""",
+                (anime_id, user['user_id'], comment_text)
+            )
+            conn.commit()
+            new_comment = cur.fetchone()
+            
+            result = dict(new_comment)
+            result['email'] = user['email']
+            
             return {
-                'statusCode': 400,
+                'statusCode': 200,
                 'headers': {
                     'Content-Type': 'application/json',
                     'Access-Control-Allow-Origin': '*'
                 },
-                'body': json.dumps({'error': 'anime_id and comment_text required'}),
+                'body': dumps_json(result),
                 'isBase64Encoded': False
             }
         
-        cur.execute(
-            """INSERT INTO comments (anime_id, user_id, comment_text) 
-               VALUES (%s, %s, %s) RETURNING id, comment_text, created_at""",
-            (anime_id, user['user_id'], comment_text)
-        )
-        conn.commit()
-        new_comment = cur.fetchone()
-        
-        result = dict(new_comment)
-        result['email'] = user['email']
-        
-        cur.close()
-        conn.close()
-        
         return {
-            'statusCode': 200,
+            'statusCode': 405,
             'headers': {
                 'Content-Type': 'application/json',
                 'Access-Control-Allow-Origin': '*'
             },
-            'body': json.dumps(result, default=str),
+            'body': json.dumps({'error': 'Method not allowed'}),
             'isBase64Encoded': False
         }
     
-    cur.close()
-    conn.close()
-    
-    return {
-        'statusCode': 405,
-        'headers': {
-            'Content-Type': 'application/json',
-            'Access-Control-Allow-Origin': '*'
-        },
-        'body': json.dumps({'error': 'Method not allowed'}),
-        'isBase64Encoded': False
-    }
+    finally:
+        cur.close()
+        release_db_connection(conn)
+
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    return run_handler(FUNCTION_NAME, event, context, handle_request, PREFLIGHT_RESPONSE, compress_response)
+
+mark_module_loaded(FUNCTION_NAME)
@@ -1,126 +1,418 @@
 '''
 Business: Rating system for anime - users can rate anime from 1 to 10
-Args: event with httpMethod (POST), body (anime_id, rating), headers (X-Auth-Token)
-Returns: HTTP response with updated anime rating
+Args: event with httpMethod (POST), body (anime_id, rating) or body (action=reconcile|flush) for admins, headers (X-Auth-Token)
+Returns: HTTP response with updated anime rating, or 202 when votes are buffered (RATINGS_WRITE_MODE=buffered)
 '''
 
 import json
 import os
-import jwt
-from typing import Dict, Any
-import psycopg2
-from psycopg2.extras import RealDictCursor
+import time
+import atexit
+import threading
+from typing import Dict, Any, Optional, Tuple
+from runtime import (
+    mark_module_loaded, run_handler, build_preflight_response, timed_phase, timed_cursor_factory,
+    psycopg2, extras, configure_db, get_db_connection, release_db_connection, decode_token, dumps_json
+)
+
+FUNCTION_NAME = 'ratings'
+RATINGS_WRITE_MODE = os.environ.get('RATINGS_WRITE_MODE', 'direct')
+RATINGS_DURABILITY = os.environ.get('RATINGS_DURABILITY', 'memory')
+RATINGS_FLUSH_SIZE = int(os.environ.get('RATINGS_FLUSH_SIZE', '200'))
+RATINGS_FLUSH_INTERVAL = float(os.environ.get('RATINGS_FLUSH_INTERVAL', '2'))
+RATINGS_JOURNAL_MAX_AGE = float(os.environ.get('RATINGS_JOURNAL_MAX_AGE', '30'))
+INT4_MAX = 2147483647
+
+configure_db(decimal_as_float=True)
 
 def get_user_from_token(token: str, jwt_secret: str) -> Dict[str, Any]:
     if not token:
         return None
     
     try:
-        payload = jwt.decode(token, jwt_secret, algorithms=['HS256'])
-        return payload
+        return decode_token(token, jwt_secret)
     except:
         return None
 
-def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
-    method: str = event.get('httpMethod', 'GET')
+def is_admin_user(user: Dict[str, Any]) -> bool:
+    return bool(user.get('is_admin')) or user.get('role') == 'admin'
+
+# rating_sum IS NULL means no real votes yet: the first vote replaces the stored rating instead of adding to it
+def apply_rating_vote(cur, anime_id: int, user_id: int, rating: int) -> Optional[Dict[str, Any]]:
+    cur.execute("SELECT id FROM anime WHERE id = %s FOR UPDATE", (anime_id,))
+    if not cur.fetchone():
+        return None
     
-    if method == 'OPTIONS':
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'POST, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-Auth-Token',
-                'Access-Control-Max-Age': '86400'
-            },
-            'body': '',
-            'isBase64Encoded': False
+    cur.execute(
+        """WITH previous AS (
+               SELECT rating FROM ratings WHERE anime_id = %(anime_id)s AND user_id = %(user_id)s
+           ), upsert AS (
+               INSERT INTO ratings (anime_id, user_id, rating) 
+               VALUES (%(anime_id)s, %(user_id)s, %(rating)s) 
+               ON CONFLICT (anime_id, user_id) 
+               DO UPDATE SET rating = EXCLUDED.rating, created_at = CURRENT_TIMESTAMP
+               RETURNING rating
+           ), delta AS (
+               SELECT 
+                   (SELECT rating FROM upsert) - COALESCE((SELECT rating FROM previous), 0) AS sum_delta,
+                   CASE WHEN EXISTS (SELECT 1 FROM previous) THEN 0 ELSE 1 END AS count_delta
+           )
+           UPDATE anime SET 
+               rating_sum = COALESCE(anime.rating_sum, 0) + delta.sum_delta,
+               rating_count = CASE WHEN anime.rating_sum IS NULL THEN 0 ELSE anime.rating_count END + delta.count_delta,
+               rating = ROUND(
+                   (COALESCE(anime.rating_sum, 0) + delta.sum_delta)::numeric 
+                   / NULLIF(CASE WHEN anime.rating_sum IS NULL THEN 0 ELSE anime.rating_count END + delta.count_delta, 0), 
+                   1
+               )
+           FROM delta
+           WHERE anime.id = %(anime_id)s
+           RETURNING anime.rating, anime.rating_count""",
+        {'anime_id': anime_id, 'user_id': user_id, 'rating': rating}
+    )
+    return cur.fetchone()
+
+def apply_rating_votes(cur, votes: Dict[Tuple[int, int], int]) -> int:
+    anime_ids = sorted({anime_id for anime_id, _ in votes})
+    cur.execute("SELECT id FROM anime WHERE id = ANY(%s) ORDER BY id FOR UPDATE", (anime_ids,))
+    
+    keys = list(votes)
+    cur.execute(
+        """WITH incoming AS (
+               SELECT v.anime_id, v.user_id, v.rating
+               FROM unnest(%(anime_ids)s::int[], %(user_ids)s::int[], %(ratings)s::int[]) AS v(anime_id, user_id, rating)
+               JOIN anime a ON a.id = v.anime_id
+           ), previous AS (
+               SELECT r.anime_id, r.user_id, r.rating 
+               FROM ratings r 
+               JOIN incoming i ON r.anime_id = i.anime_id AND r.user_id = i.user_id
+           ), upsert AS (
+               INSERT INTO ratings (anime_id, user_id, rating) 
+               SELECT anime_id, user_id, rating FROM incoming 
+               ON CONFLICT (anime_id, user_id) 
+               DO UPDATE SET rating = EXCLUDED.rating, created_at = CURRENT_TIMESTAMP
+               RETURNING anime_id, user_id, rating
+           ), delta AS (
+               SELECT 
+                   u.anime_id,
+                   SUM(u.rating - COALESCE(p.rating, 0)) AS sum_delta,
+                   COUNT(*) FILTER (WHERE p.rating IS NULL) AS count_delta
+               FROM upsert u 
+               LEFT JOIN previous p ON p.anime_id = u.anime_id AND p.user_id = u.user_id
+               GROUP BY u.anime_id
+           )
+           UPDATE anime SET 
+               rating_sum = COALESCE(anime.rating_sum, 0) + delta.sum_delta,
+               rating_count = CASE WHEN anime.rating_sum IS NULL THEN 0 ELSE anime.rating_count END + delta.count_delta,
+               rating = ROUND(
+                   (COALESCE(anime.rating_sum, 0) + delta.sum_delta)::numeric 
+                   / NULLIF(CASE WHEN anime.rating_sum IS NULL THEN 0 ELSE anime.rating_count END + delta.count_delta, 0), 
+                   1
+               )
+           FROM delta
+           WHERE anime.id = delta.anime_id""",
+        {
+            'anime_ids': [anime_id for anime_id, _ in keys],
+            'user_ids': [user_id for _, user_id in keys],
+            'ratings': [votes[key] for key in keys]
         }
+    )
+    return cur.rowcount
+
+def is_positive_int(value: Any) -> bool:
+    return isinstance(value, int) and not isinstance(value, bool) and 0 < value <= INT4_MAX
+
+_vote_buffer: Dict[Tuple[int, int], int] = {}
+_vote_buffer_lock = threading.Lock()
+_pending_votes = 0
+_pending_since: Optional[float] = None
+_flush_thread: Optional[threading.Thread] = None
+
+def buffer_vote(cur, conn, anime_id: int, user_id: int, rating: int) -> Tuple[int, bool]:
+    global _pending_votes, _pending_since
+    journal_overdue = False
+    if RATINGS_DURABILITY == 'journal':
+        # Votes journaled by a container that was frozen afterwards are drained by age, not by that container's counter
+        cur.execute(
+            """WITH journaled AS (
+                   INSERT INTO rating_vote_journal (anime_id, user_id, rating) VALUES (%s, %s, %s)
+               )
+               SELECT COALESCE((
+                   SELECT created_at < LOCALTIMESTAMP - make_interval(secs => %s) 
+                   FROM rating_vote_journal ORDER BY id LIMIT 1
+               ), false) AS overdue""",
+            (anime_id, user_id, rating, RATINGS_JOURNAL_MAX_AGE)
+        )
+        journal_overdue = cur.fetchone()['overdue']
+        conn.commit()
     
-    db_url = os.environ.get('DATABASE_URL')
-    jwt_secret = os.environ.get('JWT_SECRET', 'default-secret-change-me')
+    with _vote_buffer_lock:
+        if RATINGS_DURABILITY != 'journal':
+            _vote_buffer[(anime_id, user_id)] = rating
+        if not _pending_votes:
+            _pending_since = time.monotonic()
+        _pending_votes += 1
+        return _pending_votes, journal_overdue
+
+def take_pending_votes() -> Dict[Tuple[int, int], int]:
+    global _vote_buffer, _pending_votes, _pending_since
+    with _vote_buffer_lock:
+        votes = _vote_buffer
+        _vote_buffer = {}
+        _pending_votes = 0
+        _pending_since = None
+    return votes
+
+def restore_pending_votes(votes: Dict[Tuple[int, int], int], pending: int = 0):
+    global _pending_votes, _pending_since
+    with _vote_buffer_lock:
+        for key, rating in votes.items():
+            _vote_buffer.setdefault(key, rating)
+        _pending_votes = max(_pending_votes, len(_vote_buffer), pending)
+        if _pending_votes and _pending_since is None:
+            _pending_since = time.monotonic()
+
+def vote_flush_due() -> bool:
+    with _vote_buffer_lock:
+        if not _pending_votes:
+            return False
+        return _pending_votes >= RATINGS_FLUSH_SIZE or time.monotonic() - _pending_since >= RATINGS_FLUSH_INTERVAL
+
+def flush_rating_votes(cur, conn) -> int:
+    if RATINGS_DURABILITY == 'journal':
+        take_pending_votes()
+        cur.execute(
+            """DELETE FROM rating_vote_journal 
+               WHERE id IN (
+                   SELECT id FROM rating_vote_journal ORDER BY id LIMIT %s FOR UPDATE SKIP LOCKED
+               )
+               RETURNING id, anime_id, user_id, rating""",
+            (RATINGS_FLUSH_SIZE,)
+        )
+        rows = cur.fetchall()
+        votes = {(row['anime_id'], row['user_id']): row['rating'] for row in sorted(rows, key=lambda row: row['id'])}
+        if votes:
+            apply_rating_votes(cur, votes)
+        conn.commit()
+        
+        if len(rows) >= RATINGS_FLUSH_SIZE:
+            restore_pending_votes({}, len(rows))
+        return len(votes)
     
-    conn = psycopg2.connect(db_url)
-    cur = conn.cursor(cursor_factory=RealDictCursor)
+    votes = take_pending_votes()
+    if not votes:
+        return 0
     
-    if method == 'POST':
-        token = event.get('headers', {}).get('X-Auth-Token') or event.get('headers', {}).get('x-auth-token')
-        user = get_user_from_token(token, jwt_secret)
-        
-        if not user:
-            cur.close()
-            conn.close()
-            return {
-                'statusCode': 401,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'body': json.dumps({'error': 'Authentication required'}),
-                'isBase64Encoded': False
-            }
+    try:
+        apply_rating_votes(cur, votes)
+        conn.commit()
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        restore_pending_votes(votes)
+        raise
+    except psycopg2.Error:
+        conn.rollback()
+        return apply_rating_votes_one_by_one(cur, conn, votes)
+    
+    return len(votes)
+
+def apply_rating_votes_one_by_one(cur, conn, votes: Dict[Tuple[int, int], int]) -> int:
+    # A batch that the database rejects is retried vote by vote so one bad row cannot keep the buffer wedged
+    applied = 0
+    keys = list(votes)
+    for position, key in enumerate(keys):
+        try:
+            apply_rating_votes(cur, {key: votes[key]})
+            conn.commit()
+            applied += 1
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            restore_pending_votes({pending: votes[pending] for pending in keys[position:]})
+            raise
+        except psycopg2.Error as e:
+            conn.rollback()
+            print(json.dumps({
+                'type': 'rating_vote_dropped',
+                'anime_id': key[0],
+                'user_id': key[1],
+                'rating': votes[key],
+                'error': str(e).strip()
+            }))
+    return applied
+
+def flush_rating_votes_with_pooled_connection() -> int:
+    conn = get_db_connection()
+    cur = conn.cursor(cursor_factory=extras.RealDictCursor)
+    try:
+        return flush_rating_votes(cur, conn)
+    finally:
+        cur.close()
+        release_db_connection(conn)
+
+def run_vote_flusher():
+    while True:
+        time.sleep(RATINGS_FLUSH_INTERVAL)
+        if vote_flush_due():
+            try:
+                flush_rating_votes_with_pooled_connection()
+            except Exception:
+                pass
+
+def ensure_vote_flusher():
+    global _flush_thread
+    if _flush_thread is None or not _flush_thread.is_alive():
+        _flush_thread = threading.Thread(target=run_vote_flusher, name='rating-vote-flusher', daemon=True)
+        _flush_thread.start()
+
+def flush_votes_at_exit():
+    if RATINGS_WRITE_MODE == 'buffered' and _pending_votes:
+        try:
+            flush_rating_votes_with_pooled_connection()
+        except Exception:
+            pass
+
+atexit.register(flush_votes_at_exit)
+
+def reconcile_ratings(cur, conn, batch_size: int = 500) -> Dict[str, int]:
+    last_id = 0
+    checked = 0
+    fixed = 0
+    
+    while True:
+        cur.execute("SELECT last_id, checked, fixed FROM reconcile_anime_ratings(%s, %s)", (last_id, batch_size))
+        batch = cur.fetchone()
+        conn.commit()
         
-        body = json.loads(event.get('body', '{}'))
-        anime_id = body.get('anime_id')
-        rating = body.get('rating')
+        if not batch['checked']:
+            break
         
-        if not anime_id or rating is None or rating < 1 or rating > 10:
-            cur.close()
-            conn.close()
+        last_id = batch['last_id']
+        checked += batch['checked']
+        fixed += batch['fixed']
+    
+    return {'checked': checked, 'fixed': fixed}
+
+PREFLIGHT_RESPONSE = build_preflight_response('POST, OPTIONS')
+
+def handle_request(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    method: str = event.get('httpMethod', 'GET')
+    
+    jwt_secret = os.environ.get('JWT_SECRET', 'default-secret-change-me')
+    
+    with timed_phase('connect'):
+        conn = get_db_connection()
+    cur = conn.cursor(cursor_factory=timed_cursor_factory())
+    
+    try:
+        if method == 'POST':
+            token = event.get('headers', {}).get('X-Auth-Token') or event.get('headers', {}).get('x-auth-token')
+            user = get_user_from_token(token, jwt_secret)
+            
+            if not user:
+                return {
+                    'statusCode': 401,
+                    'headers': {
+                        'Content-Type': 'application/json',
+                        'Access-Control-Allow-Origin': '*'
+                    },
+                    'body': json.dumps({'error': 'Authentication required'}),
+                    'isBase64Encoded': False
+                }
+            
+            body = json.loads(event.get('body', '{}'))
+            
+            if body.get('action') in ('reconcile', 'flush'):
+                if not is_admin_user(user):
+                    return {
+                        'statusCode': 403,
+                        'headers': {
+                            'Content-Type': 'application/json',
+                            'Access-Control-Allow-Origin': '*'
+                        },
+                        'body': json.dumps({'error': 'Admin access required'}),
+                        'isBase64Encoded': False
+                    }
+                
+                return {
+                    'statusCode': 200,
+                    'headers': {
+                        'Content-Type': 'application/json',
+                        'Access-Control-Allow-Origin': '*'
+                    },
+                    'body': json.dumps(
+                        reconcile_ratings(cur, conn) if body['action'] == 'reconcile' else {'flushed': flush_rating_votes(cur, conn)}
+                    ),
+                    'isBase64Encoded': False
+                }
+            
+            anime_id = body.get('anime_id')
+            rating = body.get('rating')
+            
+            if not is_positive_int(anime_id) or not is_positive_int(rating) or rating > 10:
+                return {
+                    'statusCode': 400,
+                    'headers': {
+                        'Content-Type': 'application/json',
+                        'Access-Control-Allow-Origin': '*'
+                    },
+                    'body': json.dumps({'error': 'anime_id and rating (1-10) required'}),
+                    'isBase64Encoded': False
+                }
+            
+            if RATINGS_WRITE_MODE == 'buffered':
+                pending, journal_overdue = buffer_vote(cur, conn, anime_id, user['user_id'], rating)
+                ensure_vote_flusher()
+                if pending >= RATINGS_FLUSH_SIZE or journal_overdue:
+                    flush_rating_votes(cur, conn)
+                
+                return {
+                    'statusCode': 202,
+                    'headers': {
+                        'Content-Type': 'application/json',
+                        'Access-Control-Allow-Origin': '*'
+                    },
+                    'body': json.dumps({'accepted': True}),
+                    'isBase64Encoded': False
+                }
+            
+            updated = apply_rating_vote(cur, anime_id, user['user_id'], rating)
+            
+            if not updated:
+                return {
+                    'statusCode': 404,
+                    'headers': {
+                        'Content-Type': 'application/json',
+                        'Access-Control-Allow-Origin': '*'
+                    },
+                    'body': json.dumps({'error': 'Anime not found'}),
+                    'isBase64Encoded': False
+                }
+            
+            conn.commit()
+            
             return {
-                'statusCode': 400,
+                'statusCode': 200,
                 'headers': {
                     'Content-Type': 'application/json',
                     'Access-Control-Allow-Origin': '*'
                 },
-                'body': json.dumps({'error': 'anime_id and rating (1-10) required'}),
+                'body': dumps_json(updated),
                 'isBase64Encoded': False
             }
         
-        cur.execute(
-            """INSERT INTO ratings (anime_id, user_id, rating) 
-               VALUES (%s, %s, %s) 
-               ON CONFLICT (anime_id, user_id) 
-               DO UPDATE SET rating = EXCLUDED.rating, created_at = CURRENT_TIMESTAMP""",
-            (anime_id, user['user_id'], rating)
-        )
-        conn.commit()
-        
-        cur.execute(
-            "SELECT AVG(rating)::DECIMAL(3,1) as avg_rating, COUNT(*) as count FROM ratings WHERE anime_id = %s",
-            (anime_id,)
-        )
-        stats = cur.fetchone()
-        
-        cur.execute(
-            "UPDATE anime SET rating = %s, rating_count = %s WHERE id = %s RETURNING rating, rating_count",
-            (float(stats['avg_rating']), stats['count'], anime_id)
-        )
-        conn.commit()
-        updated = cur.fetchone()
-        
-        cur.close()
-        conn.close()
-        
         return {
-            'statusCode': 200,
+            'statusCode': 405,
             'headers': {
                 'Content-Type': 'application/json',
                 'Access-Control-Allow-Origin': '*'
             },
-            'body': json.dumps(dict(updated), default=str),
+            'body': json.dumps({'error': 'Method not allowed'}),
             'isBase64Encoded': False
         }
     
-    cur.close()
-    conn.close()
-    
-    return {
-        'statusCode': 405,
-        'headers': {
-            'Content-Type': 'application/json',
-            'Access-Control-Allow-Origin': '*'
-        },
-        'body': json.dumps({'error': 'Method not allowed'}),
-        'isBase64Encoded': False
-    }
+    finally:
+        cur.close()
+        release_db_connection(conn)
+
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    return run_handler(FUNCTION_NAME, event, context, handle_request, PREFLIGHT_RESPONSE)
+
+mark_module_loaded(FUNCTION_NAME)
@@ -0,0 +1,47 @@
+'''
+Business: Micro-benchmark of bcrypt verification throughput per cost factor
+Args: --costs (comma-separated rounds), --workers (comma-separated pool sizes), --duration (seconds per run)
+Returns: table of logins/sec (checkpw calls per second) for every cost/worker combination
+'''
+
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+import bcrypt
+
+PASSWORD = b'Benchmark2024!'
+
+def measure(password_hash: bytes, workers: int, duration: float) -> float:
+    deadline = time.perf_counter() + duration
+    
+    def worker() -> int:
+        done = 0
+        while time.perf_counter() < deadline:
+            bcrypt.checkpw(PASSWORD, password_hash)
+            done += 1
+        return done
+    
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        total = sum(executor.map(lambda _: worker(), range(workers)))
+    return total / (time.perf_counter() - started)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--costs', default='10,11,12,13')
+    parser.add_argument('--workers', default='1,2,4')
+    parser.add_argument('--duration', type=float, default=3.0)
+    args = parser.parse_args()
+    
+    costs = [int(cost) for cost in args.costs.split(',')]
+    worker_counts = [int(count) for count in args.workers.split(',')]
+    
+    print(f"{'cost':>4} {'workers':>7} {'ms/verify':>10} {'logins/sec':>11}")
+    for cost in costs:
+        password_hash = bcrypt.hashpw(PASSWORD, bcrypt.gensalt(rounds=cost))
+        for workers in worker_counts:
+            rate = measure(password_hash, workers, args.duration)
+            print(f"{cost:>4} {workers:>7} {1000 * workers / rate:>10.1f} {rate:>11.1f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+'''
+Business: Cold-start report for every cloud function - fresh interpreter import plus first OPTIONS preflight
+Args: --functions (comma-separated, default all), --runs (fresh processes per function, default 10)
+Returns: median/max ms for import and first preflight per function, and the slowest modules index.py imports directly
+      (from -X importtime)
+'''
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from typing import Any, Dict, List
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend')
+FUNCTIONS = ['anime', 'auth', 'change-password', 'comments', 'ratings']
+PROBE = '''
+import json, time
+started = time.perf_counter()
+import index
+imported = time.perf_counter()
+index.handler({'httpMethod': 'OPTIONS', 'headers': {}}, None)
+print(json.dumps({'import_ms': (imported - started) * 1000, 'preflight_ms': (time.perf_counter() - imported) * 1000}))
+'''
+
+def probe(function_name: str) -> Dict[str, Any]:
+    completed = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', PROBE],
+        cwd=os.path.join(BACKEND_DIR, function_name),
+        env={**os.environ, 'IMPORT_REPORT': 'off'},
+        capture_output=True,
+        text=True,
+        check=True
+    )
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    children = []
+    modules = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        _, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth == 1:
+            children.append((int(cumulative_us), name.strip()))
+        elif depth == 0:
+            if name.strip() == 'index':
+                modules = children
+            children = []
+    result['top_modules'] = [f'{name} {cumulative_us / 1000:.1f}ms' for cumulative_us, name in sorted(modules, reverse=True)[:3]]
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--functions', default=','.join(FUNCTIONS))
+    parser.add_argument('--runs', type=int, default=10)
+    args = parser.parse_args()
+    
+    print(f"{'function':<16} {'import p50':>10} {'import max':>10} {'preflight':>9}  slowest imports")
+    for function_name in [name for name in args.functions.split(',') if name]:
+        results: List[Dict[str, Any]] = [probe(function_name) for _ in range(args.runs)]
+        imports = [result['import_ms'] for result in results]
+        preflights = [result['preflight_ms'] for result in results]
+        print(f"{function_name:<16} {statistics.median(imports):>10.1f} {max(imports):>10.1f} {statistics.median(preflights):>9.2f}  {', '.join(results[-1]['top_modules'])}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+'''
+Business: Benchmark of catalog serialization engines on synthetic anime rows
+Args: --rows (catalog size, default 10000), --repeat (timed runs per engine)
+Returns: table of best/median ms per full-catalog dump and output size for every engine
+Engines: legacy (dict copy + json.dumps default=str over Decimal ratings), stdlib and orjson (when installed)
+      through backend/anime/runtime.py's encoder and encode_json_value hook, and dumps_json itself as the handlers call it
+'''
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from decimal import Decimal
+from typing import Any, Callable, Dict, List
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend', 'anime'))
+from runtime import orjson, encode_json_value, dumps_json, _json_encoder
+
+GENRES = ['Приключения', 'Фэнтези', 'Драма', 'Комедия', 'Романтика', 'Фантастика']
+TYPES = ['series', 'movie']
+
+def build_rows(count: int, decimal_ratings: bool) -> List[Dict[str, Any]]:
+    started = datetime(2024, 1, 1, 12, 0, 0)
+    rows = []
+    for index in range(count):
+        rating = (index * 37) % 100 / 10
+        rows.append(OrderedDict(
+            id=index + 1,
+            external_id=f'ext-{index}',
+            title=f'Хроники {index}',
+            description='Описание тайтла ' * 8,
+            type=TYPES[index % len(TYPES)],
+            genre=GENRES[index % len(GENRES)],
+            year=1990 + index % 35,
+            episodes=12 + index % 40,
+            rating=Decimal(f'{rating:.1f}') if decimal_ratings else rating,
+            rating_count=index % 500,
+            video_url=f'https://cdn.example.com/video/{index}.mp4',
+            thumbnail_url=f'https://cdn.example.com/thumb/{index}.jpg',
+            music_url=None,
+            created_by=1,
+            created_at=started + timedelta(minutes=index),
+            updated_at=started + timedelta(minutes=index, seconds=30)
+        ))
+    return rows
+
+def measure(dump: Callable[[], str], repeat: int) -> Dict[str, float]:
+    timings = []
+    size = 0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        size = len(dump().encode('utf-8'))
+        timings.append((time.perf_counter() - started) * 1000)
+    return {'best': min(timings), 'median': statistics.median(timings), 'size': size}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+    
+    legacy_rows = build_rows(args.rows, decimal_ratings=True)
+    rows = build_rows(args.rows, decimal_ratings=False)
+    
+    engines = {
+        'legacy': lambda: json.dumps([dict(row) for row in legacy_rows], default=str),
+        'stdlib': lambda: _json_encoder.encode(rows)
+    }
+    if orjson is not None:
+        engines['orjson'] = lambda: orjson.dumps(rows, default=encode_json_value).decode('utf-8')
+    else:
+        print('orjson is not installed; dumps_json uses the stdlib encoder')
+    engines['dumps_json'] = lambda: dumps_json(rows)
+    
+    print(f"{'engine':>10} {'best ms':>9} {'median ms':>10} {'bytes':>10}")
+    for name, dump in engines.items():
+        result = measure(dump, args.repeat)
+        print(f"{name:>10} {result['best']:>9.1f} {result['median']:>10.1f} {result['size']:>10}")
+
+if __name__ == '__main__':
+    main()
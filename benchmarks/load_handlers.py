@@ -0,0 +1,244 @@
+'''
+Business: In-process load test of the cloud function handlers against a seeded local Postgres
+Args: --scenarios (comma-separated, default all), --concurrency (8), --duration (seconds per scenario, 20),
+      --warmup (seconds, 2), --save-baseline PATH, --compare PATH, --tolerance (0.15), --gate (catalog_list,login);
+      DATABASE_URL / JWT_SECRET are passed through to the handlers, run seed_database.py first;
+      CATALOG_CACHE_TTL defaults to 0 so catalog scenarios measure the SQL and serialization, not a cache hit
+Returns: throughput and p50/p95/p99 latency per scenario; with --compare, exit code 1 when a gated
+      scenario loses more than --tolerance of its throughput or gains more than --tolerance on p95
+'''
+
+import argparse
+import base64
+import gzip
+import importlib.util
+import json
+import math
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List
+import jwt
+import psycopg2
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend')
+SCHEMA = 't_p29917108_anime_viewer_portal'
+BENCH_EMAIL = 'bench@example.com'
+BENCH_PASSWORD = os.environ.get('BENCH_PASSWORD', 'Benchmark2024!')
+SEARCH_TERMS = ['Хроники', 'Академия', 'Легенда', 'Тайна', 'Город', 'космический']
+POOL_HEADROOM = 4
+
+def load_handler(function_name: str) -> Callable[[Dict[str, Any], Any], Dict[str, Any]]:
+    function_dir = os.path.join(BACKEND_DIR, function_name)
+    path = os.path.join(function_dir, 'index.py')
+    # index.py imports its sibling runtime.py; the vendored copies are identical, so the first one loaded (with its pool) is shared
+    if function_dir not in sys.path:
+        sys.path.insert(0, function_dir)
+    spec = importlib.util.spec_from_file_location(f"bench_{function_name.replace('-', '_')}", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.handler
+
+def build_event(method: str, query: Dict[str, Any] = None, body: Dict[str, Any] = None, token: str = None) -> Dict[str, Any]:
+    headers = {'Content-Type': 'application/json', 'Accept-Encoding': 'gzip', 'User-Agent': 'load-handlers/1.0'}
+    if token:
+        headers['X-Auth-Token'] = token
+    return {
+        'httpMethod': method,
+        'headers': headers,
+        'queryStringParameters': {key: str(value) for key, value in (query or {}).items()},
+        'body': json.dumps(body) if body is not None else '',
+        'isBase64Encoded': False,
+        'requestContext': {'requestId': f'bench-{random.getrandbits(48):x}', 'identity': {'sourceIp': '127.0.0.1'}}
+    }
+
+def decode_body(response: Dict[str, Any]) -> Any:
+    body = response.get('body') or ''
+    if response.get('isBase64Encoded'):
+        raw = base64.b64decode(body)
+        if (response.get('headers') or {}).get('Content-Encoding') == 'gzip':
+            raw = gzip.decompress(raw)
+        body = raw.decode('utf-8')
+    return json.loads(body) if body else None
+
+def load_fixture() -> Dict[str, Any]:
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    try:
+        cur = conn.cursor()
+        cur.execute(f'SELECT min(id), max(id) FROM {SCHEMA}.anime')
+        first_anime, last_anime = cur.fetchone()
+        cur.execute(f"SELECT id, email, role, is_admin FROM {SCHEMA}.users WHERE email LIKE 'bench%@example.com' ORDER BY id LIMIT 1000")
+        users = cur.fetchall()
+        cur.close()
+    finally:
+        conn.close()
+    
+    if not first_anime or not users:
+        sys.exit('database is empty, run benchmarks/seed_database.py first')
+    
+    secret = os.environ.get('JWT_SECRET', 'default-secret-change-me')
+    expires = datetime.utcnow() + timedelta(days=1)
+    tokens = [
+        jwt.encode({'user_id': user_id, 'email': email, 'role': role, 'is_admin': is_admin, 'exp': expires}, secret, algorithm='HS256')
+        for user_id, email, role, is_admin in users
+    ]
+    return {'first_anime': first_anime, 'last_anime': last_anime, 'tokens': tokens}
+
+def build_scenarios(fixture: Dict[str, Any]) -> Dict[str, Callable[[], Dict[str, Any]]]:
+    anime = load_handler('anime')
+    comments = load_handler('comments')
+    ratings = load_handler('ratings')
+    auth = load_handler('auth')
+    
+    def random_anime() -> int:
+        return random.randint(fixture['first_anime'], fixture['last_anime'])
+    
+    def random_token() -> str:
+        return random.choice(fixture['tokens'])
+    
+    def catalog_deep_page() -> Dict[str, Any]:
+        response = anime(build_event('GET', {'limit': 24}), None)
+        cursor = (decode_body(response) or {}).get('next_cursor')
+        for _ in range(random.randint(1, 5)):
+            if not cursor:
+                break
+            response = anime(build_event('GET', {'limit': 24, 'cursor': cursor}), None)
+            cursor = (decode_body(response) or {}).get('next_cursor')
+        return response
+    
+    return {
+        'catalog_list': lambda: anime(build_event('GET', {'limit': 24}), None),
+        'catalog_card': lambda: anime(build_event('GET', {'limit': 24, 'view': 'card'}), None),
+        'catalog_filter': lambda: anime(build_event('GET', {'limit': 24, 'type': 'series', 'genre': 'Фэнтези'}), None),
+        'catalog_search': lambda: anime(build_event('GET', {'limit': 24, 'search': random.choice(SEARCH_TERMS)}), None),
+        'catalog_deep_page': catalog_deep_page,
+        'anime_detail': lambda: anime(build_event('GET', {'id': random_anime()}), None),
+        'comments_page': lambda: comments(build_event('GET', {'anime_id': random_anime(), 'limit': 20}), None),
+        'comment_post': lambda: comments(build_event('POST', body={'anime_id': random_anime(), 'comment_text': 'Нагрузочный комментарий'}, token=random_token()), None),
+        'rating_vote': lambda: ratings(build_event('POST', body={'anime_id': random_anime(), 'rating': random.randint(1, 10)}, token=random_token()), None),
+        'login': lambda: auth(build_event('POST', body={'action': 'login', 'email': BENCH_EMAIL, 'password': BENCH_PASSWORD}), None)
+    }
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, math.ceil(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+def run_scenario(call: Callable[[], Dict[str, Any]], concurrency: int, duration: float, warmup: float) -> Dict[str, Any]:
+    latencies: List[float] = []
+    errors = {'count': 0}
+    lock = threading.Lock()
+    warmup_until = time.perf_counter() + warmup
+    deadline = warmup_until + duration
+    
+    def worker():
+        local_latencies = []
+        local_errors = 0
+        while True:
+            started = time.perf_counter()
+            if started >= deadline:
+                break
+            try:
+                status = call().get('statusCode', 500)
+            except Exception:
+                status = 500
+            finished = time.perf_counter()
+            if started < warmup_until:
+                continue
+            local_latencies.append((finished - started) * 1000)
+            if status >= 400:
+                local_errors += 1
+        with lock:
+            latencies.extend(local_latencies)
+            errors['count'] += local_errors
+    
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for _ in range(concurrency):
+            executor.submit(worker)
+    
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': errors['count'],
+        'rps': round(len(latencies) / duration, 2),
+        'p50_ms': round(percentile(latencies, 0.50), 2),
+        'p95_ms': round(percentile(latencies, 0.95), 2),
+        'p99_ms': round(percentile(latencies, 0.99), 2),
+        'mean_ms': round(statistics.fmean(latencies), 2) if latencies else 0.0
+    }
+
+def compare_results(results: Dict[str, Any], baseline: Dict[str, Any], gated: List[str], tolerance: float) -> List[str]:
+    regressions = []
+    for name in gated:
+        current = results.get(name)
+        previous = baseline.get('scenarios', {}).get(name)
+        if not current or not previous:
+            continue
+        if previous['rps'] and current['rps'] < previous['rps'] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {current['rps']} rps vs baseline {previous['rps']} rps")
+        if previous['p95_ms'] and current['p95_ms'] > previous['p95_ms'] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {current['p95_ms']} ms vs baseline {previous['p95_ms']} ms")
+        if current['errors'] > previous['errors']:
+            regressions.append(f"{name}: {current['errors']} errors vs baseline {previous['errors']}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scenarios', default='')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=20.0)
+    parser.add_argument('--warmup', type=float, default=2.0)
+    parser.add_argument('--save-baseline')
+    parser.add_argument('--compare')
+    parser.add_argument('--tolerance', type=float, default=0.15)
+    parser.add_argument('--gate', default='catalog_list,login')
+    args = parser.parse_args()
+    
+    # Handlers size their connection pools at import time; each worker thread holds one connection per call and the
+    # security-log writer and rating-vote flusher take theirs from the same pool
+    os.environ['DB_POOL_MAX_SIZE'] = str(max(args.concurrency + POOL_HEADROOM, int(os.environ.get('DB_POOL_MAX_SIZE', '4'))))
+    # The scenarios repeat a few query keys, so with the default TTL every catalog request after the first is a cache hit
+    os.environ.setdefault('CATALOG_CACHE_TTL', '0')
+    scenarios = build_scenarios(load_fixture())
+    selected = [name for name in args.scenarios.split(',') if name] or list(scenarios)
+    unknown = [name for name in selected if name not in scenarios]
+    if unknown:
+        sys.exit(f"unknown scenarios: {', '.join(unknown)}; available: {', '.join(scenarios)}")
+    
+    results = {}
+    print(f"{'scenario':<18} {'requests':>8} {'errors':>6} {'rps':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for name in selected:
+        result = run_scenario(scenarios[name], args.concurrency, args.duration, args.warmup)
+        results[name] = result
+        print(f"{name:<18} {result['requests']:>8} {result['errors']:>6} {result['rps']:>9.1f} {result['p50_ms']:>8.1f} {result['p95_ms']:>8.1f} {result['p99_ms']:>8.1f}")
+    
+    if args.save_baseline:
+        with open(args.save_baseline, 'w', encoding='utf-8') as baseline_file:
+            json.dump({
+                'created_at': datetime.utcnow().isoformat(),
+                'concurrency': args.concurrency,
+                'duration': args.duration,
+                'scenarios': results
+            }, baseline_file, ensure_ascii=False, indent=2)
+        print(f'baseline saved to {args.save_baseline}')
+    
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as baseline_file:
+            baseline = json.load(baseline_file)
+        if baseline.get('concurrency') != args.concurrency:
+            print(f"warning: baseline was recorded at concurrency {baseline.get('concurrency')}")
+        regressions = compare_results(results, baseline, [name for name in args.gate.split(',') if name], args.tolerance)
+        for regression in regressions:
+            print(f'REGRESSION {regression}')
+        if regressions:
+            sys.exit(1)
+        print('no regressions against baseline')
+
+if __name__ == '__main__':
+    main()
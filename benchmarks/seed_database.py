@@ -0,0 +1,122 @@
+'''
+Business: Seed a local Postgres with a synthetic catalog at load-test scale
+Args: --titles (100000), --users (100000), --ratings (10000000), --comments (1000000), --reset;
+      DATABASE_URL must point at a database with db_migrations applied
+Returns: row counts per table; the login user is bench@example.com / BENCH_PASSWORD
+Rows are generated server-side with generate_series, then rating aggregates and statistics are rebuilt
+'''
+
+import argparse
+import os
+import time
+import bcrypt
+import psycopg2
+
+SCHEMA = 't_p29917108_anime_viewer_portal'
+BENCH_EMAIL = 'bench@example.com'
+BENCH_PASSWORD = os.environ.get('BENCH_PASSWORD', 'Benchmark2024!')
+BCRYPT_ROUNDS = int(os.environ.get('BCRYPT_ROUNDS', '12'))
+GENRES = ['Приключения', 'Экшен', 'Фэнтези', 'Фантастика', 'Драма', 'Комедия', 'Романтика', 'Мистика']
+WORDS = ['Хроники', 'Академия', 'Легенда', 'Тайна', 'Город', 'Путь', 'Космический', 'Последний', 'Магия', 'Герой']
+
+def run_step(cur, label: str, sql: str, params: tuple = ()):
+    started = time.perf_counter()
+    cur.execute(sql, params)
+    print(f'{label:<34} {time.perf_counter() - started:>8.1f}s')
+
+def seed(conn, titles: int, users: int, ratings: int, comments: int, reset: bool):
+    cur = conn.cursor()
+    cur.execute(f'SET search_path TO {SCHEMA}')
+    
+    if reset:
+        run_step(cur, 'truncate', 'TRUNCATE comments, ratings, rating_vote_journal, anime RESTART IDENTITY CASCADE')
+        run_step(cur, 'delete synthetic users', "DELETE FROM users WHERE email LIKE 'bench%%@example.com'")
+    
+    user_hash = bcrypt.hashpw(BENCH_PASSWORD.encode('utf-8'), bcrypt.gensalt(rounds=BCRYPT_ROUNDS)).decode('utf-8')
+    run_step(cur, 'users', """
+        INSERT INTO users (email, password_hash, is_admin, role)
+        SELECT 'bench' || CASE WHEN g = 1 THEN '' ELSE g::text END || '@example.com', %s, false, 'user'
+        FROM generate_series(1, %s) g
+        ON CONFLICT (email) DO NOTHING
+    """, (user_hash, users))
+    
+    run_step(cur, 'anime', """
+        INSERT INTO anime (external_id, title, description, type, genre, year, episodes, thumbnail_url, created_at, updated_at)
+        SELECT
+          'bench-' || g,
+          (%s::text[])[1 + g %% array_length(%s::text[], 1)] || ' ' || (%s::text[])[1 + (g / 7) %% array_length(%s::text[], 1)] || ' ' || g,
+          repeat('Описание синтетического тайтла. ', 1 + g %% 6),
+          CASE WHEN g %% 4 = 0 THEN 'movie' ELSE 'series' END,
+          (%s::text[])[1 + g %% array_length(%s::text[], 1)],
+          1980 + g %% 46,
+          CASE WHEN g %% 4 = 0 THEN 1 ELSE 12 + g %% 40 END,
+          'https://cdn.example.com/thumb/' || g || '.jpg',
+          TIMESTAMP '2015-01-01' + g * INTERVAL '1 minute',
+          TIMESTAMP '2015-01-01' + g * INTERVAL '1 minute'
+        FROM generate_series(1, %s) g
+        ON CONFLICT DO NOTHING
+    """, (WORDS, WORDS, WORDS, WORDS, GENRES, GENRES, titles))
+    
+    cur.execute("SELECT min(id), max(id) FROM anime")
+    first_anime, last_anime = cur.fetchone()
+    cur.execute("SELECT min(id), max(id) FROM users WHERE email LIKE 'bench%@example.com'")
+    first_user, last_user = cur.fetchone()
+    anime_span = last_anime - first_anime + 1
+    user_span = last_user - first_user + 1
+    
+    # Vote k goes to anime k mod anime_span from user (k div anime_span) * 997 + anime, so (anime, user) stays unique
+    run_step(cur, 'ratings', """
+        INSERT INTO ratings (anime_id, user_id, rating, created_at)
+        SELECT
+          %(first_anime)s + g %% %(anime_span)s,
+          %(first_user)s + ((g / %(anime_span)s) * 997 + g %% %(anime_span)s) %% %(user_span)s,
+          1 + (g * 7 + g / %(anime_span)s) %% 10,
+          TIMESTAMP '2020-01-01' + (g %% 1000000) * INTERVAL '1 minute'
+        FROM generate_series(0, %(ratings)s - 1) g
+        ON CONFLICT (anime_id, user_id) DO NOTHING
+    """, {'first_anime': first_anime, 'anime_span': anime_span, 'first_user': first_user, 'user_span': user_span, 'ratings': ratings})
+    
+    run_step(cur, 'comments', """
+        INSERT INTO comments (anime_id, user_id, comment_text, created_at)
+        SELECT
+          %(first_anime)s + (g * 31) %% %(anime_span)s,
+          %(first_user)s + g %% %(user_span)s,
+          'Комментарий №' || g || '. ' || repeat('Отличный тайтл! ', 1 + g %% 5),
+          TIMESTAMP '2020-01-01' + g * INTERVAL '30 seconds'
+        FROM generate_series(0, %(comments)s - 1) g
+    """, {'first_anime': first_anime, 'anime_span': anime_span, 'first_user': first_user, 'user_span': user_span, 'comments': comments})
+    
+    run_step(cur, 'rating aggregates', """
+        UPDATE anime a
+        SET rating_sum = s.total, rating_count = s.cnt, rating = ROUND(s.total::numeric / s.cnt, 1)
+        FROM (SELECT anime_id, SUM(rating) AS total, COUNT(*) AS cnt FROM ratings GROUP BY anime_id) s
+        WHERE a.id = s.anime_id
+    """)
+    conn.commit()
+    
+    conn.autocommit = True
+    for table in ('users', 'anime', 'ratings', 'comments'):
+        run_step(cur, f'analyze {table}', f'VACUUM ANALYZE {table}')
+    
+    for table in ('users', 'anime', 'ratings', 'comments'):
+        cur.execute(f'SELECT count(*) FROM {table}')
+        print(f'{table:<34} {cur.fetchone()[0]:>10} rows')
+    cur.close()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--titles', type=int, default=100000)
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('--ratings', type=int, default=10000000)
+    parser.add_argument('--comments', type=int, default=1000000)
+    parser.add_argument('--reset', action='store_true', help='truncate catalog tables and synthetic users first')
+    args = parser.parse_args()
+    
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    try:
+        seed(conn, args.titles, args.users, args.ratings, args.comments, args.reset)
+    finally:
+        conn.close()
+
+if __name__ == '__main__':
+    main()
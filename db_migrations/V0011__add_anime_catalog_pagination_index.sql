@@ -0,0 +1,10 @@
+-- Составные индексы для keyset-пагинации каталога по (created_at, id)
+
+CREATE INDEX IF NOT EXISTS idx_anime_created_id 
+ON t_p29917108_anime_viewer_portal.anime (created_at DESC, id DESC);
+
+CREATE INDEX IF NOT EXISTS idx_anime_type_created_id 
+ON t_p29917108_anime_viewer_portal.anime (type, created_at DESC, id DESC);
+
+CREATE INDEX IF NOT EXISTS idx_anime_genre_created_id 
+ON t_p29917108_anime_viewer_portal.anime (genre, created_at DESC, id DESC);
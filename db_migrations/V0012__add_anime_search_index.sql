@@ -0,0 +1,32 @@
+-- Полнотекстовый (russian) и триграммный поиск по каталогу аниме
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+ALTER TABLE t_p29917108_anime_viewer_portal.anime 
+ADD COLUMN IF NOT EXISTS search_vector tsvector;
+
+CREATE OR REPLACE FUNCTION t_p29917108_anime_viewer_portal.anime_search_vector_update() RETURNS trigger AS $$
+BEGIN
+  NEW.search_vector :=
+    setweight(to_tsvector('russian', coalesce(NEW.title, '')), 'A') ||
+    setweight(to_tsvector('russian', coalesce(NEW.description, '')), 'B');
+  RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS anime_search_vector_trigger ON t_p29917108_anime_viewer_portal.anime;
+
+CREATE TRIGGER anime_search_vector_trigger
+BEFORE INSERT OR UPDATE OF title, description ON t_p29917108_anime_viewer_portal.anime
+FOR EACH ROW EXECUTE FUNCTION t_p29917108_anime_viewer_portal.anime_search_vector_update();
+
+UPDATE t_p29917108_anime_viewer_portal.anime 
+SET search_vector =
+  setweight(to_tsvector('russian', coalesce(title, '')), 'A') ||
+  setweight(to_tsvector('russian', coalesce(description, '')), 'B');
+
+CREATE INDEX IF NOT EXISTS idx_anime_search_vector 
+ON t_p29917108_anime_viewer_portal.anime USING GIN (search_vector);
+
+CREATE INDEX IF NOT EXISTS idx_anime_title_trgm 
+ON t_p29917108_anime_viewer_portal.anime USING GIN (title gin_trgm_ops);
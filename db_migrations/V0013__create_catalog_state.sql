@@ -0,0 +1,9 @@
+-- Счётчик версии каталога для ETag / If-None-Match; увеличивается админскими изменениями anime (импорт, POST, PUT, DELETE)
+
+CREATE TABLE IF NOT EXISTS t_p29917108_anime_viewer_portal.catalog_state (
+  id INTEGER PRIMARY KEY CHECK (id = 1),
+  catalog_version BIGINT NOT NULL DEFAULT 1,
+  updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+INSERT INTO t_p29917108_anime_viewer_portal.catalog_state (id) VALUES (1) ON CONFLICT (id) DO NOTHING;
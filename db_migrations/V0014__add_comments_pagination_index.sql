@@ -0,0 +1,4 @@
+-- Составной индекс для keyset-пагинации комментариев по (created_at, id) в рамках аниме
+
+CREATE INDEX IF NOT EXISTS idx_comments_anime_created_id 
+ON t_p29917108_anime_viewer_portal.comments (anime_id, created_at DESC, id DESC);
@@ -0,0 +1,59 @@
+-- Хранимая сумма оценок для инкрементального пересчёта рейтинга аниме;
+-- NULL означает, что реальных голосов ещё не было и показываются сохранённые rating / rating_count
+
+ALTER TABLE t_p29917108_anime_viewer_portal.anime 
+ADD COLUMN IF NOT EXISTS rating_sum BIGINT;
+
+UPDATE t_p29917108_anime_viewer_portal.anime a
+SET 
+  rating_sum = s.total,
+  rating_count = s.cnt,
+  rating = ROUND(s.total::numeric / s.cnt, 1)
+FROM (
+  SELECT anime_id, SUM(rating) AS total, COUNT(*) AS cnt 
+  FROM t_p29917108_anime_viewer_portal.ratings 
+  GROUP BY anime_id
+) s
+WHERE a.id = s.anime_id;
+
+-- Сверка агрегатов с таблицей ratings пачками по id; строка anime блокируется перед пересчётом.
+-- Аниме без реальных голосов (rating_sum IS NULL) не трогаются; если голоса были и все удалены, агрегаты становятся 0/0
+CREATE OR REPLACE FUNCTION t_p29917108_anime_viewer_portal.reconcile_anime_ratings(after_id INTEGER DEFAULT 0, batch_size INTEGER DEFAULT 500)
+RETURNS TABLE (last_id INTEGER, checked INTEGER, fixed INTEGER) AS $$
+DECLARE
+  target_id INTEGER;
+  total BIGINT;
+  cnt INTEGER;
+BEGIN
+  last_id := after_id;
+  checked := 0;
+  fixed := 0;
+  
+  FOR target_id IN 
+    SELECT id FROM t_p29917108_anime_viewer_portal.anime WHERE id > after_id ORDER BY id LIMIT batch_size
+  LOOP
+    PERFORM 1 FROM t_p29917108_anime_viewer_portal.anime WHERE id = target_id FOR UPDATE;
+    
+    SELECT COALESCE(SUM(rating), 0), COUNT(*) INTO total, cnt 
+    FROM t_p29917108_anime_viewer_portal.ratings WHERE anime_id = target_id;
+    
+    UPDATE t_p29917108_anime_viewer_portal.anime 
+    SET 
+      rating_sum = total,
+      rating_count = cnt,
+      rating = COALESCE(ROUND(total::numeric / NULLIF(cnt, 0), 1), 0)
+    WHERE id = target_id 
+      AND (cnt > 0 OR rating_sum IS NOT NULL)
+      AND (rating_sum IS DISTINCT FROM total OR rating_count IS DISTINCT FROM cnt);
+    
+    IF FOUND THEN
+      fixed := fixed + 1;
+    END IF;
+    
+    last_id := target_id;
+    checked := checked + 1;
+  END LOOP;
+  
+  RETURN NEXT;
+END
+$$ LANGUAGE plpgsql;
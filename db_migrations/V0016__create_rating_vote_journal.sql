@@ -0,0 +1,10 @@
+-- Журнал голосов для буферизованной записи оценок (RATINGS_DURABILITY=journal)
+-- Без внешних ключей: вставка не должна блокировать горячую строку anime
+
+CREATE TABLE IF NOT EXISTS t_p29917108_anime_viewer_portal.rating_vote_journal (
+  id BIGSERIAL PRIMARY KEY,
+  anime_id INTEGER NOT NULL,
+  user_id INTEGER NOT NULL,
+  rating INTEGER NOT NULL CHECK (rating >= 1 AND rating <= 10),
+  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
@@ -0,0 +1,15 @@
+-- Уведомления account_state_changed при смене пароля, роли или деактивации пользователя
+-- Используются для сброса кэша состояния аккаунта в функции auth
+
+CREATE OR REPLACE FUNCTION t_p29917108_anime_viewer_portal.notify_account_state_changed() RETURNS trigger AS $$
+BEGIN
+  PERFORM pg_notify('account_state_changed', COALESCE(NEW.id, OLD.id)::text);
+  RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS users_account_state_trigger ON t_p29917108_anime_viewer_portal.users;
+
+CREATE TRIGGER users_account_state_trigger
+AFTER UPDATE OF is_active, password_hash, role, is_admin OR DELETE ON t_p29917108_anime_viewer_portal.users
+FOR EACH ROW EXECUTE FUNCTION t_p29917108_anime_viewer_portal.notify_account_state_changed();
@@ -0,0 +1,7 @@
+-- Внешний ключ аниме для массового импорта с upsert-семантикой
+
+ALTER TABLE t_p29917108_anime_viewer_portal.anime 
+ADD COLUMN IF NOT EXISTS external_id VARCHAR(255);
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_anime_external_id 
+ON t_p29917108_anime_viewer_portal.anime (external_id);
@@ -0,0 +1,8 @@
+-- Инкрементальный NDJSON-экспорт каталога: keyset по (updated_at, id)
+
+UPDATE t_p29917108_anime_viewer_portal.anime 
+SET updated_at = COALESCE(created_at, CURRENT_TIMESTAMP) 
+WHERE updated_at IS NULL;
+
+CREATE INDEX IF NOT EXISTS idx_anime_updated_at_id 
+ON t_p29917108_anime_viewer_portal.anime (updated_at, id);
@@ -0,0 +1,93 @@
+-- Сводная таблица счётчиков фасетов каталога (жанр × год × тип), поддерживается триггерами
+
+CREATE TABLE IF NOT EXISTS t_p29917108_anime_viewer_portal.anime_facets (
+  genre VARCHAR(100) NOT NULL,
+  year INTEGER NOT NULL,
+  type VARCHAR(50) NOT NULL,
+  title_count INTEGER NOT NULL DEFAULT 0,
+  PRIMARY KEY (genre, year, type)
+);
+
+CREATE INDEX IF NOT EXISTS idx_anime_facets_year ON t_p29917108_anime_viewer_portal.anime_facets (year);
+CREATE INDEX IF NOT EXISTS idx_anime_facets_type ON t_p29917108_anime_viewer_portal.anime_facets (type);
+
+-- Вставка и удаление: одна агрегированная дельта на оператор (transition tables), ключи в фиксированном порядке
+CREATE OR REPLACE FUNCTION t_p29917108_anime_viewer_portal.anime_facets_on_insert() RETURNS trigger AS $$
+BEGIN
+  INSERT INTO t_p29917108_anime_viewer_portal.anime_facets (genre, year, type, title_count)
+  SELECT genre, year, type, COUNT(*) FROM inserted_rows GROUP BY genre, year, type ORDER BY genre, year, type
+  ON CONFLICT (genre, year, type) DO UPDATE 
+  SET title_count = t_p29917108_anime_viewer_portal.anime_facets.title_count + EXCLUDED.title_count;
+  RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION t_p29917108_anime_viewer_portal.anime_facets_on_delete() RETURNS trigger AS $$
+BEGIN
+  UPDATE t_p29917108_anime_viewer_portal.anime_facets f
+  SET title_count = f.title_count - d.cnt
+  FROM (
+    SELECT genre, year, type, COUNT(*) AS cnt FROM deleted_rows GROUP BY genre, year, type ORDER BY genre, year, type
+  ) d
+  WHERE f.genre = d.genre AND f.year = d.year AND f.type = d.type;
+  RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+-- TRUNCATE anime не вызывает триггеры удаления, поэтому счётчики обнуляются отдельно
+CREATE OR REPLACE FUNCTION t_p29917108_anime_viewer_portal.anime_facets_on_truncate() RETURNS trigger AS $$
+BEGIN
+  TRUNCATE t_p29917108_anime_viewer_portal.anime_facets;
+  RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+-- Обновление: построчно и только при смене жанра, года или типа (голоса за рейтинг триггер не трогают)
+CREATE OR REPLACE FUNCTION t_p29917108_anime_viewer_portal.anime_facets_on_update() RETURNS trigger AS $$
+BEGIN
+  UPDATE t_p29917108_anime_viewer_portal.anime_facets 
+  SET title_count = title_count - 1 
+  WHERE genre = OLD.genre AND year = OLD.year AND type = OLD.type;
+  
+  INSERT INTO t_p29917108_anime_viewer_portal.anime_facets (genre, year, type, title_count)
+  VALUES (NEW.genre, NEW.year, NEW.type, 1)
+  ON CONFLICT (genre, year, type) DO UPDATE 
+  SET title_count = t_p29917108_anime_viewer_portal.anime_facets.title_count + 1;
+  RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS anime_facets_insert_trigger ON t_p29917108_anime_viewer_portal.anime;
+DROP TRIGGER IF EXISTS anime_facets_delete_trigger ON t_p29917108_anime_viewer_portal.anime;
+DROP TRIGGER IF EXISTS anime_facets_update_trigger ON t_p29917108_anime_viewer_portal.anime;
+DROP TRIGGER IF EXISTS anime_facets_truncate_trigger ON t_p29917108_anime_viewer_portal.anime;
+
+CREATE TRIGGER anime_facets_insert_trigger
+AFTER INSERT ON t_p29917108_anime_viewer_portal.anime
+REFERENCING NEW TABLE AS inserted_rows
+FOR EACH STATEMENT EXECUTE FUNCTION t_p29917108_anime_viewer_portal.anime_facets_on_insert();
+
+CREATE TRIGGER anime_facets_delete_trigger
+AFTER DELETE ON t_p29917108_anime_viewer_portal.anime
+REFERENCING OLD TABLE AS deleted_rows
+FOR EACH STATEMENT EXECUTE FUNCTION t_p29917108_anime_viewer_portal.anime_facets_on_delete();
+
+CREATE TRIGGER anime_facets_update_trigger
+AFTER UPDATE OF genre, year, type ON t_p29917108_anime_viewer_portal.anime
+FOR EACH ROW 
+WHEN (OLD.genre IS DISTINCT FROM NEW.genre OR OLD.year IS DISTINCT FROM NEW.year OR OLD.type IS DISTINCT FROM NEW.type)
+EXECUTE FUNCTION t_p29917108_anime_viewer_portal.anime_facets_on_update();
+
+CREATE TRIGGER anime_facets_truncate_trigger
+AFTER TRUNCATE ON t_p29917108_anime_viewer_portal.anime
+FOR EACH STATEMENT EXECUTE FUNCTION t_p29917108_anime_viewer_portal.anime_facets_on_truncate();
+
+-- Начальное заполнение из текущего каталога
+LOCK TABLE t_p29917108_anime_viewer_portal.anime IN SHARE ROW EXCLUSIVE MODE;
+
+TRUNCATE t_p29917108_anime_viewer_portal.anime_facets;
+
+INSERT INTO t_p29917108_anime_viewer_portal.anime_facets (genre, year, type, title_count)
+SELECT genre, year, type, COUNT(*) 
+FROM t_p29917108_anime_viewer_portal.anime 
+GROUP BY genre, year, type;
@@ -0,0 +1,89 @@
+-- Материализованные рейтинги: «Лучшее» (байесовское среднее) и «В тренде за неделю»
+
+CREATE INDEX IF NOT EXISTS idx_ratings_created_at 
+ON t_p29917108_anime_viewer_portal.ratings (created_at);
+
+CREATE INDEX IF NOT EXISTS idx_comments_created_at 
+ON t_p29917108_anime_viewer_portal.comments (created_at);
+
+-- score = (v / (v + m)) * R + (m / (v + m)) * C, где C — средняя оценка по каталогу, m = 50 голосов;
+-- для аниме без реальных голосов (rating_sum IS NULL) R — сохранённый rating
+DROP MATERIALIZED VIEW IF EXISTS t_p29917108_anime_viewer_portal.anime_top_rated;
+
+CREATE MATERIALIZED VIEW t_p29917108_anime_viewer_portal.anime_top_rated AS
+WITH prior AS (
+  SELECT 
+    COALESCE(SUM(COALESCE(rating_sum, rating * rating_count))::numeric / NULLIF(SUM(rating_count), 0), 0) AS mean_rating,
+    50::numeric AS min_votes
+  FROM t_p29917108_anime_viewer_portal.anime
+), scored AS (
+  SELECT 
+    a.id, a.title, a.type, a.genre, a.year, a.episodes, a.rating, a.rating_count, a.thumbnail_url, a.created_at,
+    (a.rating_count / (a.rating_count + p.min_votes)) * COALESCE(a.rating_sum::numeric / NULLIF(a.rating_count, 0), a.rating, 0)
+      + (p.min_votes / (a.rating_count + p.min_votes)) * p.mean_rating AS score
+  FROM t_p29917108_anime_viewer_portal.anime a CROSS JOIN prior p
+  WHERE a.rating_count > 0
+)
+SELECT ROW_NUMBER() OVER (ORDER BY score DESC, rating_count DESC, id) AS rank, ROUND(score, 4)::float8 AS score, 
+       id, title, type, genre, year, episodes, rating, rating_count, thumbnail_url, created_at
+FROM scored;
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_anime_top_rated_id ON t_p29917108_anime_viewer_portal.anime_top_rated (id);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_anime_top_rated_rank ON t_p29917108_anime_viewer_portal.anime_top_rated (rank);
+
+-- Скорость за 7 дней: голоса, взвешенные средней оценкой недели, плюс комментарии с весом 2;
+-- окно считается от LOCALTIMESTAMP, так как created_at хранится без часового пояса в локальном времени БД
+DROP MATERIALIZED VIEW IF EXISTS t_p29917108_anime_viewer_portal.anime_trending;
+
+CREATE MATERIALIZED VIEW t_p29917108_anime_viewer_portal.anime_trending AS
+WITH recent_votes AS (
+  SELECT anime_id, COUNT(*) AS votes, AVG(rating) AS avg_vote
+  FROM t_p29917108_anime_viewer_portal.ratings
+  WHERE created_at > LOCALTIMESTAMP - INTERVAL '7 days'
+  GROUP BY anime_id
+), recent_comments AS (
+  SELECT anime_id, COUNT(*) AS comments
+  FROM t_p29917108_anime_viewer_portal.comments
+  WHERE created_at > LOCALTIMESTAMP - INTERVAL '7 days'
+  GROUP BY anime_id
+), scored AS (
+  SELECT 
+    a.id, a.title, a.type, a.genre, a.year, a.episodes, a.rating, a.rating_count, a.thumbnail_url, a.created_at,
+    COALESCE(v.votes, 0) AS votes_7d,
+    COALESCE(c.comments, 0) AS comments_7d,
+    COALESCE(v.votes * (1 + v.avg_vote / 10), 0) + COALESCE(c.comments, 0) * 2 AS score
+  FROM t_p29917108_anime_viewer_portal.anime a
+  LEFT JOIN recent_votes v ON v.anime_id = a.id
+  LEFT JOIN recent_comments c ON c.anime_id = a.id
+  WHERE v.anime_id IS NOT NULL OR c.anime_id IS NOT NULL
+)
+SELECT ROW_NUMBER() OVER (ORDER BY score DESC, id) AS rank, ROUND(score, 4)::float8 AS score, votes_7d, comments_7d,
+       id, title, type, genre, year, episodes, rating, rating_count, thumbnail_url, created_at
+FROM scored;
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_anime_trending_id ON t_p29917108_anime_viewer_portal.anime_trending (id);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_anime_trending_rank ON t_p29917108_anime_viewer_portal.anime_trending (rank);
+
+CREATE TABLE IF NOT EXISTS t_p29917108_anime_viewer_portal.anime_rankings_state (
+  id INTEGER PRIMARY KEY CHECK (id = 1),
+  refreshed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+INSERT INTO t_p29917108_anime_viewer_portal.anime_rankings_state (id) VALUES (1) ON CONFLICT (id) DO NOTHING;
+
+-- Конкурентное обновление обоих представлений; параллельные вызовы отсекаются advisory-блокировкой
+CREATE OR REPLACE FUNCTION t_p29917108_anime_viewer_portal.refresh_anime_rankings() RETURNS BOOLEAN AS $$
+BEGIN
+  IF NOT pg_try_advisory_xact_lock(hashtext('anime_rankings_refresh')) THEN
+    RETURN FALSE;
+  END IF;
+  
+  REFRESH MATERIALIZED VIEW CONCURRENTLY t_p29917108_anime_viewer_portal.anime_top_rated;
+  REFRESH MATERIALIZED VIEW CONCURRENTLY t_p29917108_anime_viewer_portal.anime_trending;
+  
+  UPDATE t_p29917108_anime_viewer_portal.anime_rankings_state 
+  SET refreshed_at = CURRENT_TIMESTAMP 
+  WHERE id = 1;
+  RETURN TRUE;
+END
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,43 @@
+'''
+Business: Guard for the vendored handler runtime - every cloud function ships its own runtime.py and they must not drift
+Args: --sync copies backend/anime/runtime.py over the other functions' copies instead of only checking
+Returns: exit code 1 listing the copies that differ from backend/anime/runtime.py (or are missing)
+'''
+
+import argparse
+import filecmp
+import os
+import shutil
+import sys
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend')
+MASTER = os.path.join(BACKEND_DIR, 'anime', 'runtime.py')
+
+def runtime_copies():
+    for name in sorted(os.listdir(BACKEND_DIR)):
+        function_dir = os.path.join(BACKEND_DIR, name)
+        if name != 'anime' and os.path.isfile(os.path.join(function_dir, 'index.py')):
+            yield name, os.path.join(function_dir, 'runtime.py')
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sync', action='store_true')
+    args = parser.parse_args()
+    
+    drifted = []
+    for name, path in runtime_copies():
+        if os.path.isfile(path) and filecmp.cmp(MASTER, path, shallow=False):
+            continue
+        if args.sync:
+            shutil.copyfile(MASTER, path)
+            print(f'synced backend/{name}/runtime.py')
+        else:
+            drifted.append(name)
+    
+    if drifted:
+        print(f"runtime.py differs from backend/anime/runtime.py in: {', '.join(drifted)}; run with --sync after editing the anime copy")
+        sys.exit(1)
+    print('all runtime.py copies match backend/anime/runtime.py')
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,10 @@
+import { useEffect, useState } from 'react';
 import { Button } from '@/components/ui/button';
 import { Dialog, DialogContent, DialogHeader, DialogTitle } from '@/components/ui/dialog';
 import { Textarea } from '@/components/ui/textarea';
 import Icon from '@/components/ui/icon';
-import { type Anime, type User } from '@/lib/api';
+import { useToast } from '@/hooks/use-toast';
+import { api, type Anime, type Comment, type User } from '@/lib/api';
 import VideoPlayer from '@/components/VideoPlayer';
 import MusicPlayer from '@/components/MusicPlayer';
 
@@ -27,8 +29,35 @@ export default function AnimeDetailsDialog({
   onAddComment,
   onRate,
 }: AnimeDetailsDialogProps) {
+  const [olderComments, setOlderComments] = useState<Comment[]>([]);
+  const [commentsCursor, setCommentsCursor] = useState<string | null>(null);
+  const [loadingComments, setLoadingComments] = useState(false);
+  const { toast } = useToast();
+
+  useEffect(() => {
+    setOlderComments([]);
+    setCommentsCursor(anime?.comments_next_cursor ?? null);
+  }, [anime]);
+
+  const handleLoadMoreComments = async () => {
+    if (!anime || !commentsCursor) return;
+
+    setLoadingComments(true);
+    try {
+      const page = await api.comments.getPage(anime.id, commentsCursor);
+      setOlderComments(prev => [...prev, ...page.items]);
+      setCommentsCursor(page.next_cursor);
+    } catch (error: any) {
+      toast({ title: 'Ошибка', description: error.message, variant: 'destructive' });
+    } finally {
+      setLoadingComments(false);
+    }
+  };
+
   if (!anime) return null;
 
+  const comments = [...(anime.comments ?? []), ...olderComments];
+
   return (
     <Dialog open={open} onOpenChange={onOpenChange}>
       <DialogContent className="max-w-4xl max-h-[90vh] sm:max-h-[80vh] overflow-y-auto p-4 sm:p-6">
@@ -91,7 +120,7 @@ export default function AnimeDetailsDialog({
             </div>
 
             <div>
-              <h3 className="text-lg font-semibold mb-4">Комментарии ({anime.comments?.length || 0})</h3>
+              <h3 className="text-lg font-semibold mb-4">Комментарии ({anime.comments_total ?? comments.length})</h3>
               
               {user ? (
                 <div className="mb-4 space-y-2">
@@ -110,7 +139,7 @@ export default function AnimeDetailsDialog({
               )}
 
               <div className="space-y-3">
-                {anime.comments?.map(comment => (
+                {comments.map(comment => (
                   <div key={comment.id} className="p-3 rounded-lg bg-card border border-border">
                     <div className="flex items-start justify-between mb-2">
                       <span className="text-sm font-medium">{comment.email}</span>
@@ -122,6 +151,18 @@ export default function AnimeDetailsDialog({
                   </div>
                 ))}
               </div>
+
+              {commentsCursor && (
+                <Button
+                  variant="outline"
+                  className="w-full mt-3"
+                  onClick={handleLoadMoreComments}
+                  disabled={loadingComments}
+                >
+                  <Icon name="ChevronDown" size={16} className="mr-2" />
+                  {loadingComments ? 'Загрузка...' : 'Показать ещё'}
+                </Button>
+              )}
             </div>
           </div>
         </div>
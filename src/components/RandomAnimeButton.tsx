@@ -1,33 +1,43 @@
 import { useState } from 'react';
 import { Button } from '@/components/ui/button';
 import Icon from '@/components/ui/icon';
-import { type Anime } from '@/lib/api';
+import { api, type Anime } from '@/lib/api';
 
 interface RandomAnimeButtonProps {
   animeList: Anime[];
+  filters?: {
+    type?: string;
+    genre?: string;
+    year?: string;
+  };
   onSelect: (anime: Anime) => void;
 }
 
-export default function RandomAnimeButton({ animeList, onSelect }: RandomAnimeButtonProps) {
+export default function RandomAnimeButton({ animeList, filters, onSelect }: RandomAnimeButtonProps) {
   const [isSpinning, setIsSpinning] = useState(false);
 
   const handleRandomClick = () => {
-    if (animeList.length === 0 || isSpinning) return;
+    if (isSpinning) return;
     
     setIsSpinning(true);
     
+    // Случайный тайтл выбирает сервер, пока крутится «рулетка»
+    const pick = api.anime.getRandom(filters).catch(() => {
+      if (animeList.length === 0) return null;
+      return animeList[Math.floor(Math.random() * animeList.length)];
+    });
+    
     // Анимация "рулетки"
     let counter = 0;
     const interval = setInterval(() => {
       counter++;
       if (counter > 10) {
         clearInterval(interval);
-        setIsSpinning(false);
         
-        // Выбираем случайное аниме
-        const randomIndex = Math.floor(Math.random() * animeList.length);
-        const randomAnime = animeList[randomIndex];
-        onSelect(randomAnime);
+        pick.then(randomAnime => {
+          setIsSpinning(false);
+          if (randomAnime) onSelect(randomAnime);
+        });
       }
     }, 100);
   };
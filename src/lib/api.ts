@@ -21,6 +21,9 @@ export interface Anime {
   created_at?: string;
   updated_at?: string;
   comments?: Comment[];
+  comments_total?: number;
+  comments_next_cursor?: string | null;
+  rating_histogram?: number[];
 }
 
 export interface Comment {
@@ -30,6 +33,11 @@ export interface Comment {
   created_at: string;
 }
 
+export interface CommentsPage {
+  items: Comment[];
+  next_cursor: string | null;
+}
+
 export interface User {
   id: number;
   email: string;
@@ -100,6 +108,33 @@ export const api = {
       return data;
     },
 
+    getRandom: async (filters?: {
+      type?: string;
+      genre?: string;
+      year?: string;
+    }): Promise<Anime> => {
+      const params = new URLSearchParams({ random: '1', view: 'card' });
+      if (filters?.type && filters.type !== 'all') params.append('type', filters.type);
+      if (filters?.genre && filters.genre !== 'Все') params.append('genre', filters.genre);
+      if (filters?.year && filters.year !== 'Все') params.append('year', filters.year);
+
+      const response = await fetch(`${API_URLS.anime}?${params.toString()}`);
+      const data = await response.json();
+      if (!response.ok) throw new Error(data.error || 'Failed to fetch random anime');
+      return data;
+    },
+
+    getMany: async (ids: number[], view?: 'card' | 'full'): Promise<{ items: Anime[]; missing: number[] }> => {
+      const response = await fetch(`${API_URLS.anime}?action=batch`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ ids, view }),
+      });
+      const data = await response.json();
+      if (!response.ok) throw new Error(data.error || 'Failed to fetch anime');
+      return data;
+    },
+
     getById: async (id: number): Promise<Anime> => {
       const response = await fetch(`${API_URLS.anime}?id=${id}`);
       const data = await response.json();
@@ -156,6 +191,17 @@ export const api = {
       return data;
     },
 
+    getPage: async (animeId: number, cursor?: string | null, limit?: number): Promise<CommentsPage> => {
+      const params = new URLSearchParams({ anime_id: String(animeId) });
+      if (limit) params.append('limit', String(limit));
+      if (cursor) params.append('cursor', cursor);
+
+      const response = await fetch(`${API_URLS.comments}?${params.toString()}`);
+      const data = await response.json();
+      if (!response.ok) throw new Error(data.error || 'Failed to fetch comments');
+      return data;
+    },
+
     create: async (animeId: number, commentText: string): Promise<Comment> => {
       const token = getToken();
       const response = await fetch(API_URLS.comments, {
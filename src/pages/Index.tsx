@@ -196,6 +196,7 @@ export default function Index() {
 
       <RandomAnimeButton 
         animeList={anime.animeList}
+        filters={{ type: selectedType, genre: selectedGenre, year: selectedYear }}
         onSelect={handleOpenAnimeDetails}
       />
 